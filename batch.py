@@ -0,0 +1,172 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from collections import deque
+from multiprocessing import Pool
+from rubiks_cube import *
+from solve import solve, solve_engines, move_list_to_string, phase1_search, phase2_search, phase3_search, phase4_search
+from cache import SolutionCache
+from transposition import TranspositionTable
+from instrumentation import profiling
+
+# Batch solving
+# Cube states are read one at a time from a file or stdin, solved by a pool of worker processes and written
+# back as one JSON line each, in the order they were read. Only a bounded number of cubes are in the pool at
+# once, so memory stays flat however long the input is.
+
+
+def read_cube_strings(lines):
+    """
+    Read cubes written either as 6 lines of 9 chars (like rubiks_data.txt) or as one line of 54 chars
+    :param lines: iterable of lines
+    :return: generator of the 54 char cube strings. A line that is not part of a cube, or the lines of a cube
+             cut short, are given as they are, so they get an error line in their place and the batch goes on
+    """
+    face_lines = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if len(line) == 9:
+            face_lines.append(line)
+            if len(face_lines) == 6:
+                yield "".join(face_lines)
+                face_lines = []
+            continue
+        if face_lines:
+            yield "".join(face_lines)
+            face_lines = []
+        yield line
+    if face_lines:
+        yield "".join(face_lines)
+
+
+# The SolutionCache of this worker process, if the batch uses one, the key of solve_engines it solves with
+# and its TranspositionTable, if the batch uses one
+worker_cache = None
+worker_engine = 'thistlethwaite'
+worker_transposition = None
+
+
+def load_tables(cache_path=None, engine='thistlethwaite', transposition_capacity=None):
+    """
+    Pool initializer, every worker loads the distance tables once before its first cube
+    :param cache_path: optional sqlite file of a SolutionCache shared by the workers
+    :param engine: key of solve_engines the worker solves with
+    :param transposition_capacity: optional number of coordinates a TranspositionTable of each worker keeps,
+                                   the thistlethwaite searches then skip coordinates they reached before
+    """
+    global worker_cache, worker_engine, worker_transposition
+    worker_engine = engine
+    if transposition_capacity:
+        worker_transposition = TranspositionTable(transposition_capacity)
+    if engine == 'kociemba':
+        import kociemba
+        kociemba.load_tables()
+    else:
+        for phase in (phase1_search, phase2_search, phase3_search, phase4_search):
+            phase.distance()
+    if cache_path is not None:
+        worker_cache = SolutionCache(cache_path)
+
+
+def solve_cube_string(numbered_cube):
+    """
+    :param numbered_cube: tuple (input position, 54 char cube string)
+    :return: dict of the result, ready to write as JSON. With a transposition table its counters so far in this
+             worker are the 'transposition' entry
+    """
+    index, cube_string = numbered_cube
+    result = {'index': index, 'cube': cube_string}
+    try:
+        transposition = worker_transposition if worker_engine == 'thistlethwaite' else None
+        solution = solve(string_to_faces(cube_string), cache=worker_cache, engine=worker_engine,
+                         transposition=transposition)
+        result['solution'] = move_list_to_string(solution).strip()
+        result['length'] = len(solution)
+        if transposition is not None:
+            result['transposition'] = transposition.stats()
+    except ValueError as error:
+        result['error'] = str(error)
+    except Exception as error:
+        # Any other failure of one cube is reported on its line, it must not end the whole stream
+        result['error'] = type(error).__name__ + ": " + str(error)
+    return result
+
+
+def solve_stream(cube_strings, workers=None, max_in_flight=None, cache_path=None, engine='thistlethwaite',
+                 transposition_capacity=None):
+    """
+    Solve cubes in a process pool, yielding the results in input order
+    :param cube_strings: iterable of 54 char cube strings, only read as fast as the pool solves them
+    :param workers: number of worker processes, one per cpu when None
+    :param max_in_flight: most cubes handed to the pool and not yet yielded, 4 per worker when None
+    :param cache_path: optional sqlite file of a SolutionCache the workers look cubes up in
+    :param engine: key of solve_engines the workers solve with
+    :param transposition_capacity: see load_tables
+    :return: generator of result dicts
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if max_in_flight is None:
+        max_in_flight = 4 * workers
+
+    with Pool(workers, initializer=load_tables, initargs=(cache_path, engine, transposition_capacity)) as pool:
+        in_flight = deque()
+        for numbered_cube in enumerate(cube_strings):
+            in_flight.append(pool.apply_async(solve_cube_string, (numbered_cube,)))
+            if len(in_flight) >= max_in_flight:
+                yield in_flight.popleft().get()
+        while in_flight:
+            yield in_flight.popleft().get()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve many cubes, one JSON line of output per cube")
+    parser.add_argument('input', nargs='?', default='-', help="file of cubes, - or nothing for stdin")
+    parser.add_argument('-o', '--output', default='-', help="file to write the JSON lines to, - for stdout")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="worker processes, default one per cpu")
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help="most cubes being solved at once, default 4 per worker")
+    parser.add_argument('--cache', default=None, help="sqlite file to cache solutions in")
+    parser.add_argument('--engine', default='thistlethwaite', choices=sorted(solve_engines),
+                        help="kociemba gives shorter solutions, taking about 0.05 seconds per cube")
+    parser.add_argument('--transposition', type=int, default=None,
+                        help="coordinates a transposition table in each worker keeps, its counters go on every line")
+    parser.add_argument('--log-level', default='WARNING', help="DEBUG logs every search event to stderr")
+    parser.add_argument('--profile', default=None,
+                        help="solve in this process under cProfile and tracemalloc, writing the report to this file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper())
+
+    infile = sys.stdin if args.input == '-' else open(args.input, 'r')
+    outfile = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        if args.profile is not None:
+            # Profiling only sees this process, so the cubes are not handed to a pool
+            load_tables(args.cache, args.engine, args.transposition)
+            report = {}
+            with profiling(report):
+                results = map(solve_cube_string, enumerate(read_cube_strings(infile)))
+                for result in results:
+                    outfile.write(json.dumps(result) + "\n")
+            with open(args.profile, 'w') as profile_file:
+                profile_file.write(report['profile'])
+                profile_file.write("Peak traced memory " + str(report['peak_bytes']) + " bytes\n")
+                profile_file.write("\n".join(report['allocations']) + "\n")
+        else:
+            for result in solve_stream(read_cube_strings(infile), args.workers, args.max_in_flight, args.cache,
+                                       args.engine, args.transposition):
+                outfile.write(json.dumps(result) + "\n")
+                outfile.flush()
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+import numpy as np
+from rubiks_cube import *
+from coordinates import cubies_to_state, permutation_parity
+from solve import *
+
+# Solver benchmarks
+# Every cube comes from a seeded generator, so two runs on the same code measure the same work. The results
+# are one flat dict of metrics written as JSON, and can be checked against a baseline saved by an earlier run.
+# Metrics ending in _per_sec are better higher, every other metric is better lower.
+
+solved_cube = 'o' * 9 + 'y' * 9 + 'r' * 9 + 'w' * 9 + 'g' * 9 + 'b' * 9
+
+phase_functions = (phase1, phase2, phase3, phase4)
+phase_searches = (phase1_search, phase2_search, phase3_search, phase4_search)
+
+
+# Scrambles
+#---------------------------------------------------------------------------------------
+
+
+def random_scramble(rng, length):
+    """
+    :param rng: np random Generator
+    :param length: number of moves
+    :return: list of string moves, no two in a row on the same face
+    """
+    scramble = []
+    while len(scramble) < length:
+        each_move = all_moves[rng.integers(len(all_moves))]
+        if not scramble or scramble[-1][0] != each_move[0]:
+            scramble.append(each_move)
+    return scramble
+
+
+def random_permutation(rng, n, parity):
+    """
+    :return: np int array of a random permutation of 0..n-1 with the given parity
+    """
+    perm = rng.permutation(n)
+    if permutation_parity(perm) != parity:
+        perm[[0, 1]] = perm[[1, 0]]
+    return perm
+
+
+def random_state_faces(rng):
+    """
+    A cube drawn uniformly from every solvable cube, which a short scramble does not give
+    :param rng: np random Generator
+    :return: the np chararray of cube
+    """
+    corner_perm = rng.permutation(8)
+    edge_perm = random_permutation(rng, 12, permutation_parity(corner_perm))
+    corner_ori = rng.integers(3, size=8)
+    corner_ori[-1] = -corner_ori[:-1].sum() % 3
+    edge_ori = rng.integers(2, size=12)
+    edge_ori[-1] = edge_ori[:-1].sum() % 2
+    return state_to_faces(cubies_to_state(corner_perm, corner_ori, edge_perm, edge_ori))
+
+
+def scrambled_faces(rng, length):
+    """
+    :return: the np chararray of a cube scrambled by length random moves
+    """
+    return move(random_scramble(rng, length), string_to_faces(solved_cube))
+
+
+def benchmark_cubes(seed, count, scramble_length):
+    """
+    :param seed: int seed of the generator
+    :param count: number of cubes of each kind
+    :param scramble_length: moves in each scramble, 0 gives only the uniformly random states
+    :return: list of the np chararray cubes, scrambles first
+    """
+    rng = np.random.default_rng(seed)
+    cubes = [scrambled_faces(rng, scramble_length) for _ in range(count)] if scramble_length else []
+    return cubes + [random_state_faces(rng) for _ in range(count)]
+
+
+# Measurements
+#---------------------------------------------------------------------------------------
+
+
+def percentiles(name, seconds):
+    """
+    :param name: prefix of the metric names
+    :param seconds: list of timings
+    :return: dict of the mean, p50, p90, p99 and max in milliseconds
+    """
+    ms = np.array(seconds) * 1000
+    return {name + '_mean_ms': float(ms.mean()), name + '_p50_ms': float(np.percentile(ms, 50)),
+            name + '_p90_ms': float(np.percentile(ms, 90)), name + '_p99_ms': float(np.percentile(ms, 99)),
+            name + '_max_ms': float(ms.max())}
+
+
+def measure_moves(rng, count):
+    """
+    :return: dict of the moves per second of move on one cube and of move_batch on a batch
+    """
+    sequence = random_scramble(rng, count)
+    faces = string_to_faces(solved_cube)
+    start = time.perf_counter()
+    for each_move in sequence:
+        move([each_move], faces)
+    single = count / (time.perf_counter() - start)
+
+    states = np.repeat(faces_to_state(faces)[None], 1000, axis=0)
+    indexes = rng.integers(len(all_moves), size=(count // 1000 + 1, 1000))
+    start = time.perf_counter()
+    for row in indexes:
+        states = move_batch(states, row)
+    batch = indexes.size / (time.perf_counter() - start)
+    return {'move_per_sec': single, 'move_batch_per_sec': batch}
+
+
+def measure_depth_search(cubes, depth):
+    """
+    Expand every phase to a fixed depth with a goal that is never met, so each phase does the same work
+    :param depth: depth searched from every cube
+    :return: dict of the nodes per second of depth_search for each phase
+    """
+    never = lambda states: np.zeros(len(states), dtype=bool)
+    metrics = {}
+    for phase in phase_searches:
+        stats = {}
+        start = time.perf_counter()
+        for faces in cubes:
+            depth_search(np.array(phase.banned), depth, never, faces, stats=stats)
+        metrics['depth_search_' + phase.name + '_nodes_per_sec'] = stats['nodes'] / (time.perf_counter() - start)
+    return metrics
+
+
+def measure_solves(cubes, strategy):
+    """
+    Solve every cube phase by phase, timing each phase and the whole solve
+    :return: dict of the latency percentiles and the search nodes per second of each phase
+    """
+    phase_times = [[] for _ in phase_functions]
+    phase_nodes = [0 for _ in phase_functions]
+    solve_times = []
+    lengths = []
+    for faces in cubes:
+        start = time.perf_counter()
+        lengths.append(len(solve(faces, strategy=strategy)))
+        solve_times.append(time.perf_counter() - start)
+
+        cube = faces.copy()
+        for p, (phase, search) in enumerate(zip(phase_functions, phase_searches)):
+            stats = {}
+            start = time.perf_counter()
+            solved = phase(cube, strategy, stats)
+            phase_times[p].append(time.perf_counter() - start)
+            phase_nodes[p] += stats.get('nodes', 0)
+            if type(solved) == list:
+                move(solved, cube)
+
+    metrics = percentiles('solve', solve_times)
+    metrics['solve_mean_length'] = float(np.mean(lengths))
+    for search, times, nodes in zip(phase_searches, phase_times, phase_nodes):
+        metrics.update(percentiles(search.name, times))
+        metrics[search.name + '_nodes_per_sec'] = nodes / sum(times)
+    return metrics
+
+
+def measure_memory(cubes, strategy):
+    """
+    :return: dict of the peak python allocation of one solve and, where the resource module exists (not on
+             windows), the peak resident memory of the process
+    """
+    peak = 0
+    for faces in cubes:
+        tracemalloc.start()
+        solve(faces, strategy=strategy)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    metrics = {'solve_peak_alloc_kb': peak / 1024}
+    try:
+        import resource
+    except ImportError:
+        return metrics
+    # ru_maxrss is in bytes on macOS and kilobytes everywhere else
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    metrics['peak_rss_mb'] = max_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return metrics
+
+
+def run(seed=0, count=50, scramble_length=25, search_depth=4, strategy='ida'):
+    """
+    :param seed: int seed of every random cube and move
+    :param count: number of cubes of each kind, scrambled and uniformly random
+    :param scramble_length: moves in each scramble
+    :param search_depth: depth of the fixed depth_search runs
+    :param strategy: key of search_strategies the solves use
+    :return: dict of metric name -> value
+    """
+    start = time.perf_counter()
+    for search in phase_searches:
+        search.distance()
+    results = {'table_load_seconds': time.perf_counter() - start}
+
+    rng = np.random.default_rng(seed)
+    cubes = benchmark_cubes(seed, count, scramble_length)
+    results.update(measure_moves(rng, 100000))
+    results.update(measure_depth_search(cubes[:5], search_depth))
+    results.update(measure_solves(cubes, strategy))
+    results.update(measure_memory(cubes[:5], strategy))
+    return results
+
+
+def compare(results, baseline, threshold=0.2):
+    """
+    :param results: dict of metrics of this run
+    :param baseline: dict of metrics of an earlier run
+    :param threshold: allowed relative change for the worse, 0.2 is 20%
+    :return: list of strings, one per metric that regressed past the threshold
+    """
+    regressions = []
+    for name, old in baseline.items():
+        new = results.get(name)
+        if new is None or old == 0:
+            continue
+        change = (old - new) / old if name.endswith('_per_sec') else (new - old) / old
+        if change > threshold:
+            regressions.append(name + ": " + format(old, '.4g') + " -> " + format(new, '.4g') +
+                               " (" + format(change * 100, '.1f') + "% worse)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the solver on seeded cubes")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--count', type=int, default=50, help="cubes of each kind, scrambled and uniformly random")
+    parser.add_argument('--scramble-length', type=int, default=25)
+    parser.add_argument('--search-depth', type=int, default=4, help="depth of the fixed depth_search runs")
+    parser.add_argument('--strategy', default='ida', choices=sorted(search_strategies))
+    parser.add_argument('-o', '--output', default=None, help="file to write the JSON results to, default stdout")
+    parser.add_argument('--baseline', default=None, help="JSON results of an earlier run to compare against")
+    parser.add_argument('--save-baseline', default=None, help="file to save these results to as the new baseline")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="relative regression that fails the run, default 0.2")
+    args = parser.parse_args(argv)
+
+    results = run(args.seed, args.count, args.scramble_length, args.search_depth, args.strategy)
+    report = json.dumps(results, indent=2, sort_keys=True)
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, 'w') as outfile:
+            outfile.write(report + "\n")
+    if args.save_baseline is not None:
+        with open(args.save_baseline, 'w') as outfile:
+            outfile.write(report + "\n")
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as infile:
+            regressions = compare(results, json.load(infile), args.threshold)
+        for regression in regressions:
+            print("REGRESSION " + regression, file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
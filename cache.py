@@ -0,0 +1,109 @@
+import sqlite3
+import numpy as np
+from rubiks_cube import *
+from symmetry import representative, conjugate_move_list, inverse_symmetry
+
+# Persistent solution cache
+# Solutions are stored in sqlite under a key every scan of the same cube shares: the colors are first
+# relabelled by the centers, so the color scheme does not matter, then the state is reduced by the 48
+# symmetries, so it does not matter how the cube was held (or mirrored) when scanned. Each engine keeps its
+# own solutions, a cube first solved by one engine is still solved by the other when asked for.
+
+
+def canonical_key(faces, engine='thistlethwaite'):
+    """
+    :param faces: the np chararray of cube
+    :param engine: key of solve.solve_engines the solution is from
+    :return: tuple (bytes key, index of the symmetry that turns the relabelled cube into the keyed one)
+    """
+    state = faces_to_state(faces)
+    face_of_color = np.zeros(256, dtype=np.uint8)
+    face_of_color[state[4::9]] = np.arange(6, dtype=np.uint8)
+    keyed, symmetries = representative(face_of_color[state][None])
+    return engine.encode() + b':' + keyed[0].tobytes(), int(symmetries[0])
+
+
+def is_solved(faces):
+    """
+    :param faces: the np chararray of cube
+    :return: True when every face is one color
+    """
+    state = faces_to_state(faces).reshape(6, 9)
+    return bool((state == state[:, 4:5]).all())
+
+
+class SolutionCache:
+    """
+    sqlite file of cube key -> solution, dropping the least recently used entries past max_entries
+    """
+
+    def __init__(self, path, max_entries=100000):
+        """
+        :param path: the sqlite file, created if it does not exist
+        :param max_entries: most solutions kept
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS solutions "
+                                "(key BLOB PRIMARY KEY, solution TEXT NOT NULL, last_used INTEGER NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS solutions_last_used ON solutions (last_used)")
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def next_use(self):
+        """
+        :return: int larger than the last_used of every entry
+        """
+        return self.connection.execute("SELECT COALESCE(MAX(last_used), 0) + 1 FROM solutions").fetchone()[0]
+
+    def get(self, faces, engine='thistlethwaite'):
+        """
+        :param faces: the np chararray of cube
+        :param engine: key of solve.solve_engines the solution must be from
+        :return: list of string moves solving the cube, None when it is not cached
+        """
+        key, s = canonical_key(faces, engine)
+        row = self.connection.execute("SELECT solution FROM solutions WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            # Stored for the keyed cube, turn it back into moves for this one
+            solution = conjugate_move_list(row[0].split(), int(inverse_symmetry[s]))
+            if is_solved(move(solution, faces.copy())):
+                self.connection.execute("UPDATE solutions SET last_used = ? WHERE key = ?", (self.next_use(), key))
+                self.connection.commit()
+                self.hits += 1
+                return solution
+        self.misses += 1
+        return None
+
+    def put(self, faces, solution, engine='thistlethwaite'):
+        """
+        :param faces: the np chararray of cube
+        :param solution: list of string moves solving it
+        :param engine: key of solve.solve_engines that found the solution
+        """
+        key, s = canonical_key(faces, engine)
+        self.connection.execute("INSERT OR REPLACE INTO solutions (key, solution, last_used) VALUES (?, ?, ?)",
+                                (key, " ".join(conjugate_move_list(solution, s)), self.next_use()))
+        count = self.connection.execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+        if count > self.max_entries:
+            self.connection.execute("DELETE FROM solutions WHERE key IN "
+                                    "(SELECT key FROM solutions ORDER BY last_used LIMIT ?)", (count - self.max_entries,))
+            self.evictions += count - self.max_entries
+        self.connection.commit()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+
+    def stats(self):
+        """
+        :return: dict of the counters of this instance and the entries in the file
+        """
+        lookups = self.hits + self.misses
+        return {'size': len(self), 'max_entries': self.max_entries, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def close(self):
+        self.connection.close()
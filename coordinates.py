@@ -0,0 +1,438 @@
+import itertools
+import math
+import numpy as np
+from rubiks_cube import *
+
+# Cubie and coordinate level representation of the cube
+# Instead of 54 stickers the cube is 8 corner and 12 edge pieces (cubies), each with a position and an
+# orientation. A coordinate packs one property of all cubies into a single small int, and a move table
+# maps (coordinate, move) -> coordinate so a search never has to touch the stickers.
+
+#          0  1  2  3  4  5
+# faces = [B, U, F, D, R, L]
+
+# Sticker indexes of a face visited going clockwise around it
+face_cycle = (0, 1, 2, 5, 8, 7, 6, 3)
+
+# Edge positions, grouped by slice. The first face of the name holds the reference sticker of the position:
+# the F or B sticker if the edge has one, else the U or D sticker. An edge is oriented (0) when the
+# reference sticker of the cubie sits there. F, B, L, R and U2, D2 never change edge orientation.
+edge_names = ('FU', 'BU', 'FD', 'BD', 'FR', 'FL', 'BR', 'BL', 'UR', 'UL', 'DR', 'DL')
+m_slice = (0, 1, 2, 3)  # between L and R
+e_slice = (4, 5, 6, 7)  # between U and D
+s_slice = (8, 9, 10, 11)  # between F and B
+
+# Corner positions. The reference sticker of a corner is its L or R sticker, L, R and the half turns
+# never change corner orientation
+corner_names = ('URF', 'UFL', 'ULB', 'UBR', 'DFR', 'DLF', 'DBL', 'DRB')
+
+
+def edge_facelets_between(face_a, face_b):
+    """
+    Use face_to_edges to find the two stickers of the edge between two faces
+    :param face_a: char of the first face
+    :param face_b: char of the second face
+    :return: tuple of the flat sticker indexes (on face_a, on face_b)
+    """
+    a, b = moves_dict[face_a], moves_dict[face_b]
+    for index, (other_face, other_index) in face_to_edges[a].items():
+        if other_face == b:
+            return a * 9 + index, b * 9 + other_index
+    raise ValueError(face_a + " and " + face_b + " do not share an edge")
+
+
+def corner_facelets_between(corner_name):
+    """
+    Use face_to_edges to find the three stickers of a corner
+    :param corner_name: string of the three faces meeting at the corner
+    :return: tuple of the flat sticker indexes going clockwise around the corner, starting at the L or R sticker
+    """
+    corner_faces = [moves_dict[c] for c in corner_name]
+    stickers = {}
+    for face in corner_faces:
+        # The corner sits between the two edges of this face that touch the other two faces
+        for i, index in enumerate(face_cycle):
+            if index in corners:
+                before = face_to_edges[face][face_cycle[i - 1]][0]
+                after = face_to_edges[face][face_cycle[(i + 1) % 8]][0]
+                if {face, before, after} == set(corner_faces):
+                    # Clockwise around the corner the face of the edge before it comes next
+                    stickers[face] = (face * 9 + index, before)
+
+    start = moves_dict['R'] if moves_dict['R'] in stickers else moves_dict['L']
+    ordered = [stickers[start][0]]
+    face = stickers[start][1]
+    while face != start:
+        ordered.append(stickers[face][0])
+        face = stickers[face][1]
+    return tuple(ordered)
+
+
+edge_facelets = np.array([edge_facelets_between(name[0], name[1]) for name in edge_names], dtype=np.intp)
+corner_facelets = np.array([corner_facelets_between(name) for name in corner_names], dtype=np.intp)
+
+
+def state_to_cubies(state):
+    """
+    Read the cubies of a state, the colors of the centers decide which face each color belongs to
+    :param state: np uint8 array of length 54
+    :return: tuple of np int arrays (corner permutation, corner orientation, edge permutation, edge orientation),
+             position i holds cubie permutation[i] with orientation[i]
+    """
+    state = np.asarray(state)
+    color_face = np.full(256, -1, dtype=np.intp)
+    color_face[state[4::9]] = np.arange(6)
+    sticker_faces = color_face[state]
+
+    corner_homes = {frozenset(home // 9): i for i, home in enumerate(corner_facelets)}
+    edge_homes = {frozenset(home // 9): i for i, home in enumerate(edge_facelets)}
+    lr_faces = (moves_dict['R'], moves_dict['L'])
+
+    corner_perm = np.empty(8, dtype=np.intp)
+    corner_ori = np.empty(8, dtype=np.intp)
+    for i, facelets in enumerate(corner_facelets):
+        cubie_faces = sticker_faces[facelets]
+        corner_perm[i] = corner_homes.get(frozenset(cubie_faces), -1)
+        corner_ori[i] = next((j for j, f in enumerate(cubie_faces) if f in lr_faces), -1)
+
+    edge_perm = np.empty(12, dtype=np.intp)
+    edge_ori = np.empty(12, dtype=np.intp)
+    for i, facelets in enumerate(edge_facelets):
+        cubie_faces = sticker_faces[facelets]
+        edge_perm[i] = edge_homes.get(frozenset(cubie_faces), -1)
+        # The reference sticker of the cubie is the first sticker of its home position
+        edge_ori[i] = 0 if cubie_faces[0] == edge_facelets[edge_perm[i]][0] // 9 else 1
+
+    if (corner_perm < 0).any() or (edge_perm < 0).any() or (corner_ori < 0).any() or \
+            len(set(corner_perm)) != 8 or len(set(edge_perm)) != 12:
+        raise ValueError("The stickers do not make a valid cube")
+    return corner_perm, corner_ori, edge_perm, edge_ori
+
+
+def faces_to_cubies(faces):
+    """
+    :param faces: the np chararray of cube
+    :return: tuple (corner permutation, corner orientation, edge permutation, edge orientation)
+    """
+    return state_to_cubies(faces_to_state(faces))
+
+
+def cubies_to_state(corner_perm, corner_ori, edge_perm, edge_ori, colors='oyrwgb'):
+    """
+    Put the stickers of the cubies back on the faces, the inverse of state_to_cubies
+    :param colors: the center colors of the faces in order B, U, F, D, R, L
+    :return: np uint8 array of length 54
+    """
+    solved = np.repeat(np.frombuffer(colors.encode(), dtype=np.uint8), 9)
+    state = solved.copy()
+    for i in range(8):
+        for k in range(3):
+            state[corner_facelets[i][(k + corner_ori[i]) % 3]] = solved[corner_facelets[corner_perm[i]][k]]
+    for i in range(12):
+        for k in range(2):
+            state[edge_facelets[i][(k + edge_ori[i]) % 2]] = solved[edge_facelets[edge_perm[i]][k]]
+    return state
+
+
+def build_cubie_moves():
+    """
+    Read every move as cubies, by applying it to a solved cube
+    :return: tuple of np int arrays of size 18, 8 or 18, 12 (corner perm, corner ori, edge perm, edge ori)
+    """
+    solved = np.repeat(np.arange(6, dtype=np.uint8), 9)
+    cubies = [state_to_cubies(solved[move_permutations[i]]) for i in range(len(all_moves))]
+    return tuple(np.array(part) for part in zip(*cubies))
+
+
+corner_move_perm, corner_move_ori, edge_move_perm, edge_move_ori = build_cubie_moves()
+
+
+# Coordinates
+#---------------------------------------------------------------------------------------
+# Every coordinate function works on one cubie array or on a batch of them (N, 8) / (N, 12)
+
+
+def edge_orientation_coord(edge_ori):
+    """
+    :param edge_ori: np int array of edge orientations
+    :return: int 0..2047, the last edge is fixed by the others
+    """
+    return np.asarray(edge_ori)[..., :11] @ (2 ** np.arange(11))
+
+
+def corner_orientation_coord(corner_ori):
+    """
+    :param corner_ori: np int array of corner orientations
+    :return: int 0..2186, the last corner is fixed by the others
+    """
+    return np.asarray(corner_ori)[..., :7] @ (3 ** np.arange(7))
+
+
+def edge_orientations(coords):
+    """
+    :param coords: np int array of edge orientation coordinates
+    :return: np int array of size N, 12
+    """
+    ori = (np.asarray(coords)[:, None] >> np.arange(11)) & 1
+    return np.concatenate((ori, ori.sum(axis=1, keepdims=True) % 2), axis=1)
+
+
+def corner_orientations(coords):
+    """
+    :param coords: np int array of corner orientation coordinates
+    :return: np int array of size N, 8
+    """
+    ori = (np.asarray(coords)[:, None] // (3 ** np.arange(7))) % 3
+    return np.concatenate((ori, -ori.sum(axis=1, keepdims=True) % 3), axis=1)
+
+
+def permutation_coord(perm):
+    """
+    Rank of a permutation in lexicographic order (the order of itertools.permutations)
+    :param perm: np int array of a permutation of 0..n-1
+    :return: int 0..n!-1
+    """
+    perm = np.asarray(perm)
+    n = perm.shape[-1]
+    rank = np.zeros(perm.shape[:-1], dtype=np.intp)
+    for i in range(n - 1):
+        smaller_after = (perm[..., i + 1:] < perm[..., i:i + 1]).sum(axis=-1)
+        rank = rank + smaller_after * math.factorial(n - 1 - i)
+    return rank
+
+
+def permutation_parity(perm):
+    """
+    :param perm: np int array of a permutation
+    :return: 0 for an even permutation, 1 for odd
+    """
+    perm = np.asarray(perm)
+    return int((perm[:, None] > perm[None, :])[np.triu_indices(len(perm), 1)].sum() % 2)
+
+
+def all_permutations(n):
+    """
+    :param n: number of items
+    :return: np int array of size n!, n, row i has permutation_coord i
+    """
+    return np.array(list(itertools.permutations(range(n))), dtype=np.intp)
+
+
+# A slice coordinate is which 4 of the 12 edge positions hold the 4 edges of a slice
+slice_positions = np.array(list(itertools.combinations(range(12), 4)), dtype=np.intp)
+slice_rank = np.full(1 << 12, -1, dtype=np.intp)
+slice_rank[(1 << slice_positions).sum(axis=1)] = np.arange(len(slice_positions))
+
+
+def slice_coord(edge_perm, slice_edges):
+    """
+    :param edge_perm: np int array of edge permutations
+    :param slice_edges: tuple of the 4 edge cubies of the slice
+    :return: int 0..494
+    """
+    in_slice = np.isin(np.asarray(edge_perm), slice_edges)
+    return slice_rank[in_slice @ (1 << np.arange(12))]
+
+
+def slice_permutation_coord(edge_perm, slice_edges):
+    """
+    Order of the 4 edges inside their own slice, only meaningful when they are all in it
+    :param edge_perm: np int array of edge permutations
+    :param slice_edges: tuple of the 4 edge positions of the slice
+    :return: int 0..23
+    """
+    return permutation_coord(np.asarray(edge_perm)[..., list(slice_edges)] - slice_edges[0])
+
+
+def apply_orientation_move(ori, move_i, modulo, move_perm, move_ori):
+    """
+    :return: orientations after move_i, for a batch of orientation arrays
+    """
+    return (ori[:, move_perm[move_i]] + move_ori[move_i]) % modulo
+
+
+def build_edge_orientation_table():
+    """
+    :return: np int array of size 2048, 18 of the edge orientation after each move
+    """
+    ori = edge_orientations(np.arange(2048))
+    return np.stack([edge_orientation_coord(apply_orientation_move(ori, i, 2, edge_move_perm, edge_move_ori))
+                     for i in range(len(all_moves))], axis=1)
+
+
+def build_corner_orientation_table():
+    """
+    :return: np int array of size 2187, 18 of the corner orientation after each move
+    """
+    ori = corner_orientations(np.arange(2187))
+    return np.stack([corner_orientation_coord(apply_orientation_move(ori, i, 3, corner_move_perm, corner_move_ori))
+                     for i in range(len(all_moves))], axis=1)
+
+
+def build_slice_table():
+    """
+    Slices are told apart by the edges, not the positions, so one table serves all three slices
+    :return: np int array of size 495, 18 of the slice coordinate after each move
+    """
+    occupied = np.zeros((len(slice_positions), 12), dtype=bool)
+    np.put_along_axis(occupied, slice_positions, True, axis=1)
+    return np.stack([slice_rank[occupied[:, edge_move_perm[i]] @ (1 << np.arange(12))]
+                     for i in range(len(all_moves))], axis=1)
+
+
+def build_corner_permutation_table():
+    """
+    :return: np int array of size 40320, 18 of the corner permutation after each move
+    """
+    perms = all_permutations(8)
+    return np.stack([permutation_coord(perms[:, corner_move_perm[i]]) for i in range(len(all_moves))], axis=1)
+
+
+def build_slice_permutation_table(slice_edges):
+    """
+    Only half turns keep every edge in its slice, the other moves have -1 in the table
+    :param slice_edges: tuple of the 4 edge positions of the slice
+    :return: np int array of size 24, 18 of the order of the slice edges after each move
+    """
+    perms = np.tile(np.arange(12), (24, 1))
+    perms[:, list(slice_edges)] = all_permutations(4) + slice_edges[0]
+    table = np.full((24, len(all_moves)), -1, dtype=np.intp)
+    for i in range(len(all_moves)):
+        moved = perms[:, edge_move_perm[i]]
+        if np.isin(moved[:, list(slice_edges)], slice_edges).all():
+            table[:, i] = slice_permutation_coord(moved, slice_edges)
+    return table
+
+
+edge_orientation_move = build_edge_orientation_table()
+corner_orientation_move = build_corner_orientation_table()
+slice_move = build_slice_table()
+corner_permutation_move = build_corner_permutation_table()
+slice_permutation_move = {edges_of_slice: build_slice_permutation_table(edges_of_slice)
+                          for edges_of_slice in (m_slice, e_slice, s_slice)}
+
+half_turns = [i for i, each_move in enumerate(all_moves) if each_move[1] == '2']
+
+
+def build_half_turn_corner_permutations():
+    """
+    The corner permutations half turns alone can reach from solved
+    :return: np int array of the 96 corner permutation coordinates
+    """
+    reached = {0}
+    frontier = [0]
+    while frontier:
+        frontier = [int(corner_permutation_move[c, i]) for c in frontier for i in half_turns
+                    if int(corner_permutation_move[c, i]) not in reached]
+        reached.update(frontier)
+    return np.array(sorted(reached), dtype=np.intp)
+
+
+# Corner permutation coordinate -> index 0..95, -1 outside the half turn group
+half_turn_corner_perms = build_half_turn_corner_permutations()
+half_turn_corner_index = np.full(40320, -1, dtype=np.intp)
+half_turn_corner_index[half_turn_corner_perms] = np.arange(len(half_turn_corner_perms))
+
+# Once the M slice edges are in the M slice they stay there, the E slice edges then only use the other
+# 8 positions: slice coordinate -> index 0..69, -1 when an E slice edge is in the M slice
+g2_e_slice_coords = np.flatnonzero(~np.isin(slice_positions, m_slice).any(axis=1))
+g2_e_slice_index = np.full(len(slice_positions), -1, dtype=np.intp)
+g2_e_slice_index[g2_e_slice_coords] = np.arange(len(g2_e_slice_coords))
+
+# Coordinates of the solved cube
+solved_slice = {edges_of_slice: int(slice_coord(np.arange(12), edges_of_slice))
+                for edges_of_slice in (m_slice, e_slice, s_slice)}
+
+
+def faces_to_coordinates(faces):
+    """
+    :param faces: the np chararray of cube
+    :return: dict of every coordinate of the cube
+    """
+    corner_perm, corner_ori, edge_perm, edge_ori = faces_to_cubies(faces)
+    return {'edge_orientation': int(edge_orientation_coord(edge_ori)),
+            'corner_orientation': int(corner_orientation_coord(corner_ori)),
+            'm_slice': int(slice_coord(edge_perm, m_slice)),
+            'e_slice': int(slice_coord(edge_perm, e_slice)),
+            's_slice': int(slice_coord(edge_perm, s_slice)),
+            'corner_permutation': int(permutation_coord(corner_perm)),
+            'm_slice_permutation': int(slice_permutation_coord(edge_perm, m_slice)),
+            'e_slice_permutation': int(slice_permutation_coord(edge_perm, e_slice)),
+            's_slice_permutation': int(slice_permutation_coord(edge_perm, s_slice))}
+
+
+# Phase goals
+#---------------------------------------------------------------------------------------
+# Phase 1: all edges oriented
+# Phase 2: all corners oriented (L and R colors on L and R) and the M slice edges in the M slice
+# Phase 3: every edge in its slice and a corner permutation half turns can solve
+# Phase 4: solved
+
+
+def is_phase1_coord_complete(edge_orientation):
+    """
+    :param edge_orientation: the edge orientation coordinate
+    :return: True of False whether phase one is done
+    """
+    return edge_orientation == 0
+
+
+def is_phase2_coord_complete(corner_orientation, m_slice_coord):
+    """
+    :param corner_orientation: the corner orientation coordinate
+    :param m_slice_coord: the slice coordinate of the M slice edges
+    :return: True of False whether phase two is done
+    """
+    return (corner_orientation == 0) & (m_slice_coord == solved_slice[m_slice])
+
+
+def is_phase3_coord_complete(corner_permutation, e_slice_coord):
+    """
+    :param corner_permutation: the corner permutation coordinate
+    :param e_slice_coord: the slice coordinate of the E slice edges
+    :return: True of False whether phase three is done
+    """
+    return (half_turn_corner_index[corner_permutation] >= 0) & (e_slice_coord == solved_slice[e_slice])
+
+
+def is_solvable(faces):
+    """
+    A scan can have every cubie and still be impossible to solve: one twisted corner, one flipped edge
+    or two swapped pieces
+    :param faces: the np chararray of cube
+    :return: True of False whether turning the faces can solve the cube
+    """
+    try:
+        corner_perm, corner_ori, edge_perm, edge_ori = faces_to_cubies(faces)
+    except ValueError:
+        return False
+    return corner_ori.sum() % 3 == 0 and edge_ori.sum() % 2 == 0 and \
+        permutation_parity(corner_perm) == permutation_parity(edge_perm)
+
+
+# Distance tables
+#---------------------------------------------------------------------------------------
+
+
+def build_distance_table(size, goal_coords, move_coord, phase_move_indexes):
+    """
+    Breadth first search out from the goal over a whole coordinate space, the moves of a phase are closed
+    under inverse so the distance from the goal is also the distance to it
+    :param size: number of values the coordinate can take
+    :param goal_coords: np int array of the coordinates that satisfy the goal
+    :param move_coord: function (np int array of coordinates, move index) -> coordinates after the move
+    :param phase_move_indexes: indexes into all_moves of the moves allowed
+    :return: np int8 array of length size, the fewest moves to the goal (-1 when it can not be reached)
+    """
+    distance = np.full(size, -1, dtype=np.int8)
+    frontier = np.unique(np.asarray(goal_coords, dtype=np.intp))
+    distance[frontier] = 0
+
+    depth = 0
+    while len(frontier):
+        depth += 1
+        for i in phase_move_indexes:
+            reached = move_coord(frontier, i)
+            distance[reached[distance[reached] < 0]] = depth
+        frontier = np.flatnonzero(distance == depth)
+    return distance
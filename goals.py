@@ -0,0 +1,89 @@
+import numpy as np
+from rubiks_cube import *
+
+# Goals written as sticker masks
+# A goal lists, for the stickers it cares about, which colors are allowed there. It is compiled once
+# into a lookup table, then a whole batch of states is tested with one gather.
+
+# Sticker chars of the faces in order B, U, F, D, R, L
+all_colors = 'oyrwgb'
+
+
+def color_codes(colors):
+    """
+    :param colors: a string of color chars
+    :return: np uint8 array of the ascii codes, comparable with the stickers of a state
+    """
+    return np.frombuffer(colors.encode(), dtype=np.uint8)
+
+
+class StickerGoal:
+    """
+    A goal satisfied when every listed sticker has one of its allowed colors
+    """
+
+    def __init__(self, allowed):
+        """
+        :param allowed: dict of (face index, sticker index) -> string of the colors allowed there
+        """
+        self.allowed = dict(allowed)
+
+        # One row of 256 ascii codes per sticker checked
+        self.stickers = np.array([face * 9 + index for face, index in self.allowed], dtype=np.intp)
+        self.lookup = np.zeros((len(self.stickers), 256), dtype=bool)
+        for row, colors in enumerate(self.allowed.values()):
+            self.lookup[row, color_codes(colors)] = True
+        self.rows = np.arange(len(self.stickers))
+
+    def __call__(self, states):
+        """
+        :param states: np uint8 array of size N, 54
+        :return: np bool array of length N, True where the goal is satisfied
+        """
+        return self.lookup[self.rows, states[:, self.stickers]].all(axis=1)
+
+    def check(self, faces):
+        """
+        :param faces: the np chararray of cube
+        :return: True of False whether the goal is satisfied
+        """
+        return bool(self(faces_to_state(faces)[None])[0])
+
+    def __and__(self, other):
+        """
+        :return: a StickerGoal satisfied when both goals are
+        """
+        allowed = dict(self.allowed)
+        for sticker, colors in other.allowed.items():
+            allowed[sticker] = ''.join(c for c in allowed.get(sticker, colors) if c in colors)
+        return StickerGoal(allowed)
+
+
+def forbidden_colors(forbidden):
+    """
+    Turn a list of the colors a sticker must not have into the colors it may have
+    :param forbidden: dict of (face index, sticker index) -> string of the colors not allowed there
+    :return: dict of (face index, sticker index) -> string of the colors allowed there
+    """
+    return {sticker: ''.join(c for c in all_colors if c not in colors) for sticker, colors in forbidden.items()}
+
+
+def solved_stickers_goal(stickers):
+    """
+    :param stickers: list of (face index, sticker index)
+    :return: a StickerGoal satisfied when all of the stickers have the color of their face
+    """
+    return StickerGoal({(face, index): all_colors[face] for face, index in stickers})
+
+
+def cross_goal(face):
+    """
+    A cross is the 4 edges of a face solved, including the sticker each has on the side
+    :param face: char of the face
+    :return: a StickerGoal
+    """
+    face = moves_dict[face]
+    stickers = [(face, 4)]
+    for index in edges:
+        stickers += [(face, index), face_to_edges[face][index]]
+    return solved_stickers_goal(stickers)
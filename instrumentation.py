@@ -0,0 +1,66 @@
+import cProfile
+import io
+import json
+import logging
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+
+# Search instrumentation
+# The searches describe their progress as events, plain dicts with an 'event' key:
+#   'depth' once per depth (or depth bound) searched, with the nodes generated, goal checks, effective
+#           branching factor, seconds taken and, for the breadth first searches, the frontier and its memory
+#   'phase' once per phase of a solve, with its wall time, moves and nodes
+#   'solve' once per solve, with its wall time and move counts
+# Every event goes to the optional observer function the search was given, and to the 'rubiks' logger at
+# DEBUG level as JSON, so logging.basicConfig(level=logging.DEBUG) shows a whole solve.
+
+logger = logging.getLogger('rubiks')
+
+
+def emit(observer, event):
+    """
+    :param observer: optional function taking the event dict
+    :param event: dict of the event
+    """
+    if observer is not None:
+        observer(event)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(json.dumps(event, default=float))
+
+
+def branching_factor(nodes, previous_nodes):
+    """
+    :param nodes: nodes generated at this depth
+    :param previous_nodes: nodes generated at the depth before (or the frontier expanded)
+    :return: float, how many times more nodes this depth took, 0 when there is nothing to compare with
+    """
+    return nodes / previous_nodes if previous_nodes else 0.0
+
+
+@contextmanager
+def profiling(report, memory=True, top=20, sort='cumulative'):
+    """
+    Profile the block with cProfile, and tracemalloc when memory is True
+    :param report: dict filled when the block ends, 'profile' gets the text of the top functions, 'peak_bytes'
+                   and 'allocations' the peak traced memory and the lines that allocated the most
+    :param memory: also trace allocations, slows the block down a lot more than cProfile
+    :param top: number of functions and allocation lines reported
+    :param sort: pstats sort key of the functions
+    """
+    profiler = cProfile.Profile()
+    if memory:
+        tracemalloc.start()
+    profiler.enable()
+    try:
+        yield report
+    finally:
+        profiler.disable()
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats(sort).print_stats(top)
+        report['profile'] = text.getvalue()
+        if memory:
+            snapshot = tracemalloc.take_snapshot()
+            report['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            report['allocations'] = [str(stat) for stat in snapshot.statistics('lineno')[:top]]
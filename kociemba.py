@@ -0,0 +1,337 @@
+import time
+import numpy as np
+from rubiks_cube import *
+from coordinates import *
+from solve import SearchPhase, phase2_search, phase2_coordinate, phase2_move, can_follow, optimize_moves
+from instrumentation import emit
+
+# Two phase (Kociemba) solving
+# Phase 1 takes the cube into G1 = <L, R, U2, D2, F2, B2> with any of the 18 moves: edges oriented, corners
+# oriented and the M slice edges in the M slice, the first two phases of solve.py in one. Phase 2 solves the
+# cube inside G1 with only the moves of G1. A short phase 1 is not kept like in solve.py: the search goes on
+# through the longer phase 1 solutions, each finished by the shortest phase 2 that beats the best total.
+# Every coordinate has a move table and the distance tables are of two coordinates each, the larger of the
+# two distances prunes the search.
+
+g1_moves = [move_index[m] for m in ('L1', 'L2', 'L3', 'R1', 'R2', 'R3', 'U2', 'D2', 'F2', 'B2')]
+g1_banned = [m for m in all_moves if move_index[m] not in g1_moves]
+
+# The 8 edges outside the M slice, phase 2 only ever moves them among their own positions
+g1_edges = e_slice + s_slice
+
+max_phase1_depth = 12
+max_phase2_depth = 18
+
+# When solve gives no deadline, the search for a shorter solution stops after this many seconds, or as
+# soon as a solution of target_length moves or fewer is found
+default_budget = 0.05
+target_length = 22
+# Until a first solution is found, phase 2 may only make it this many moves longer than the target once the
+# time is up, a long phase 2 costs far more than searching on through phase 1
+overtime_moves = 2
+
+
+def build_g1_edge_permutation_table():
+    """
+    :return: np int array of size 40320, 18 of the order of the 8 edges outside the M slice after each move,
+             -1 for the moves that are not in G1
+    """
+    perms = np.tile(np.arange(12), (40320, 1))
+    perms[:, list(g1_edges)] = all_permutations(8) + g1_edges[0]
+    table = np.full((40320, len(all_moves)), -1, dtype=np.intp)
+    for i in g1_moves:
+        table[:, i] = permutation_coord(perms[:, edge_move_perm[i]][:, list(g1_edges)] - g1_edges[0])
+    return table
+
+
+g1_edge_permutation_move = build_g1_edge_permutation_table()
+
+
+def g1_edge_permutation_coord(edge_perm):
+    """
+    :param edge_perm: np int array of an edge permutation with the M slice edges in the M slice
+    :return: int 0..40319
+    """
+    return int(permutation_coord(np.asarray(edge_perm)[list(g1_edges)] - g1_edges[0]))
+
+
+# Distance tables
+#---------------------------------------------------------------------------------------
+# Phase 1 uses corner orientation x M slice (the table of phase 2 of solve.py, but with all 18 moves) and
+# edge orientation x M slice, and corner orientation x edge orientation, which prunes far more of phase 1
+# than the two slice tables alone. Phase 2 uses corner permutation x M slice order and edge order x M slice order.
+
+
+def edge_slice_coordinate(faces):
+    """
+    :return: the edge orientation and M slice position of the faces packed into one int
+    """
+    corner_perm, corner_ori, edge_perm, edge_ori = faces_to_cubies(faces)
+    return int(edge_orientation_coord(edge_ori)) * 495 + int(slice_coord(edge_perm, m_slice))
+
+
+def edge_slice_move(coords, i):
+    """
+    :return: the edge orientation x M slice coordinate after move i
+    """
+    return edge_orientation_move[coords // 495, i] * 495 + slice_move[coords % 495, i]
+
+
+def corner_edge_coordinate(faces):
+    """
+    :return: the corner orientation and edge orientation of the faces packed into one int
+    """
+    corner_perm, corner_ori, edge_perm, edge_ori = faces_to_cubies(faces)
+    return int(corner_orientation_coord(corner_ori)) * 2048 + int(edge_orientation_coord(edge_ori))
+
+
+def corner_edge_move(coords, i):
+    """
+    :return: the corner orientation x edge orientation coordinate after move i
+    """
+    return corner_orientation_move[coords // 2048, i] * 2048 + edge_orientation_move[coords % 2048, i]
+
+
+def corner_order_coordinate(faces):
+    """
+    :return: the corner permutation and the order of the M slice edges packed into one int
+    """
+    corner_perm, corner_ori, edge_perm, edge_ori = faces_to_cubies(faces)
+    return int(permutation_coord(corner_perm)) * 24 + int(slice_permutation_coord(edge_perm, m_slice))
+
+
+def corner_order_move(coords, i):
+    """
+    :return: the corner permutation x M slice order coordinate after move i
+    """
+    return corner_permutation_move[coords // 24, i] * 24 + slice_permutation_move[m_slice][coords % 24, i]
+
+
+def edge_order_coordinate(faces):
+    """
+    :return: the order of the edges outside the M slice and of the M slice edges packed into one int
+    """
+    corner_perm, corner_ori, edge_perm, edge_ori = faces_to_cubies(faces)
+    return g1_edge_permutation_coord(edge_perm) * 24 + int(slice_permutation_coord(edge_perm, m_slice))
+
+
+def edge_order_move(coords, i):
+    """
+    :return: the edge order x M slice order coordinate after move i
+    """
+    return g1_edge_permutation_move[coords // 24, i] * 24 + slice_permutation_move[m_slice][coords % 24, i]
+
+
+corner_slice_pruning = SearchPhase('kociemba_corner_slice', [], 2187 * 495, phase2_coordinate, phase2_move,
+                                   phase2_search.goal_coords)
+edge_slice_pruning = SearchPhase('kociemba_edge_slice', [], 2048 * 495, edge_slice_coordinate, edge_slice_move,
+                                 [solved_slice[m_slice]])
+corner_order_pruning = SearchPhase('kociemba_corner_order', g1_banned, 40320 * 24, corner_order_coordinate,
+                                   corner_order_move, [0])
+edge_order_pruning = SearchPhase('kociemba_edge_order', g1_banned, 40320 * 24, edge_order_coordinate,
+                                 edge_order_move, [0])
+corner_edge_pruning = SearchPhase('kociemba_corner_edge', [], 2187 * 2048, corner_edge_coordinate, corner_edge_move,
+                                  [0])
+pruning_tables = (corner_slice_pruning, edge_slice_pruning, corner_edge_pruning, corner_order_pruning,
+                  edge_order_pruning)
+
+
+class Tables:
+    """
+    Phase 1 is searched one node at a time, its tables are python lists and bytes since indexing them with
+    ints is several times faster than indexing np arrays. Phase 2 is searched a whole depth at a time, its
+    tables stay np arrays with only the columns of the G1 moves
+    """
+
+    def __init__(self):
+        self.edge_orientation = edge_orientation_move.tolist()
+        self.corner_orientation = corner_orientation_move.tolist()
+        self.slice = slice_move.tolist()
+        # Every coordinate can reach the goal, so no distance is -1 and they fit in bytes
+        self.corner_slice, self.edge_slice, self.corner_edge = [
+            phase.distance().astype(np.uint8).tobytes()
+            for phase in (corner_slice_pruning, edge_slice_pruning, corner_edge_pruning)]
+
+        self.corner_permutation = corner_permutation_move[:, g1_moves]
+        self.edge_permutation = g1_edge_permutation_move[:, g1_moves]
+        self.slice_order = slice_permutation_move[m_slice][:, g1_moves]
+        self.corner_order = corner_order_pruning.distance()
+        self.edge_order = edge_order_pruning.distance()
+
+    def phase2_distance(self, cp, ep, sp):
+        """
+        :return: np array of the fewest phase 2 moves each coordinate could still need
+        """
+        return np.maximum(self.corner_order[cp * 24 + sp], self.edge_order[ep * 24 + sp])
+
+
+# Built the first time the engine is used
+tables = None
+
+
+def load_tables():
+    """
+    :return: the Tables, building or loading them the first time
+    """
+    global tables
+    if tables is None:
+        tables = Tables()
+    return tables
+
+
+class SearchDone(Exception):
+    """
+    Raised inside the search once it is out of time or has a short enough solution
+    """
+
+
+# Phase 1 move index (None at the start) -> list of the move indexes to try next
+phase1_successors = {last: [i for i in range(len(all_moves))
+                            if can_follow(None if last is None else all_moves[last], all_moves[i])]
+                     for last in [None] + list(range(len(all_moves)))}
+
+
+def g1_search(t, cp, ep, sp, longest, stop_time=None):
+    """
+    Shortest phase 2 of at most longest moves. Each depth bound is searched breadth first, one np array per
+    depth, keeping only the coordinates the distance tables allow and each coordinate once
+    :param t: the Tables
+    :param cp: corner permutation coordinate
+    :param ep: coordinate of the order of the edges outside the M slice
+    :param sp: coordinate of the order of the M slice edges
+    :param longest: the most moves allowed
+    :param stop_time: optional time.monotonic() value, no new depth is started after it
+    :return: tuple (list of move indexes or None, number of coordinates generated)
+    """
+    nodes = 0
+    start = (np.array([cp]), np.array([ep]), np.array([sp]))
+    g1_move_array = np.array(g1_moves)
+    for bound in range(int(t.phase2_distance(*start)[0]), longest + 1):
+        cps, eps, sps = start
+        layers = []
+        for depth in range(bound):
+            if stop_time is not None and time.monotonic() > stop_time:
+                return None, nodes
+            cps, eps, sps = t.corner_permutation[cps].ravel(), t.edge_permutation[eps].ravel(), \
+                t.slice_order[sps].ravel()
+            nodes += len(cps)
+            keep = np.flatnonzero(t.phase2_distance(cps, eps, sps) < bound - depth)
+            keys, first = np.unique((cps[keep] * 40320 + eps[keep]) * 24 + sps[keep], return_index=True)
+            kept = keep[first]
+            cps, eps, sps = cps[kept], eps[kept], sps[kept]
+            # Parent in the depth before and the move from it
+            layers.append((kept // len(g1_moves), g1_move_array[kept % len(g1_moves)]))
+            if not len(kept):
+                break
+        else:
+            # Only the goal has distance 0, so everything left at the bound is solved
+            path = []
+            index = 0
+            for parents, layer_moves in reversed(layers):
+                path.append(int(layer_moves[index]))
+                index = parents[index]
+            return path[::-1], nodes
+    return None, nodes
+
+
+def two_phase(faces, stop_time=None, target=None, observer=None, stats=None):
+    """
+    Solve the cube with the two phase algorithm, searching on for shorter solutions until stop_time
+    :param faces: the np chararray of the cube
+    :param stop_time: time.monotonic() value to stop searching for shorter solutions at, default_budget
+                      seconds from now when None. The first solution is always returned, even after stop_time
+    :param target: a solution of this many moves or fewer is returned straight away. When None, target_length
+                   without a stop_time, and a stop_time given is always searched until
+    :param observer: optional function given an 'improved' event for every shorter solution
+    :param stats: optional dict, 'nodes' is increased by the number of coordinates generated and 'raw_length'
+                  is the length of the solution before the turns where the phases meet were merged
+    :return: a list of string moves
+    """
+    t = load_tables()
+    start_time = time.monotonic()
+    if target is None and stop_time is None:
+        target = target_length
+    # The first solution is looked for among the short ones, whether or not it stops the search
+    first_target = target_length if target is None else target
+    if stop_time is None:
+        stop_time = start_time + default_budget
+    corner_perm, corner_ori, edge_perm, edge_ori = faces_to_cubies(faces)
+    g1_move_set = set(g1_moves)
+
+    best = None
+    best_raw_length = None
+    phase1_path = []
+    phase1_exhausted = False
+    nodes = 0
+
+    def finish_phase1():
+        # The cube is in G1, look for a phase 2 short enough to beat the best solution
+        nonlocal best, best_raw_length, nodes
+        cp, ep = corner_perm, edge_perm
+        for i in phase1_path:
+            cp, ep = cp[corner_move_perm[i]], ep[edge_move_perm[i]]
+        if best is not None:
+            longest, phase2_stop = min(max_phase2_depth, len(best) - len(phase1_path) - 1), stop_time
+        else:
+            # A long phase 2 costs far more than searching on through phase 1, so the first solution may only be
+            # first_target moves, a few more once the time is up, and any length once phase 1 has run out
+            if phase1_exhausted:
+                longest, phase2_stop = max_phase2_depth, None
+            elif time.monotonic() < stop_time:
+                longest, phase2_stop = min(max_phase2_depth, first_target - len(phase1_path)), stop_time
+            else:
+                longest, phase2_stop = min(max_phase2_depth, first_target + overtime_moves - len(phase1_path)), None
+        path, phase2_nodes = g1_search(t, int(permutation_coord(cp)), g1_edge_permutation_coord(ep),
+                                       int(slice_permutation_coord(ep, m_slice)), longest, phase2_stop)
+        nodes += phase2_nodes
+        if path is not None:
+            # The last phase 1 turn and the first phase 2 turn can be of the same face
+            best_raw_length = len(phase1_path) + len(path)
+            best = optimize_moves([all_moves[i] for i in phase1_path + path])
+            emit(observer, {'event': 'improved', 'length': len(best), 'phase1_length': len(phase1_path),
+                            'seconds': time.monotonic() - start_time})
+            if target is not None and len(best) <= target:
+                raise SearchDone
+        if best is not None and time.monotonic() > stop_time:
+            raise SearchDone
+
+    def phase1(eo, co, sl, depth_left, last):
+        nonlocal nodes
+        if depth_left == 0:
+            # A phase 1 ending in a G1 move was already in G1 one move earlier, that solution was tried
+            if not phase1_path or phase1_path[-1] not in g1_move_set:
+                finish_phase1()
+            return
+        if best is not None and time.monotonic() > stop_time:
+            raise SearchDone
+        for i in phase1_successors[last]:
+            neo, nco, nsl = t.edge_orientation[eo][i], t.corner_orientation[co][i], t.slice[sl][i]
+            nodes += 1
+            distance = max(t.corner_slice[nco * 495 + nsl], t.edge_slice[neo * 495 + nsl],
+                           t.corner_edge[nco * 2048 + neo])
+            # Without the distance 0 check the search would also end phase 1 in G1 early and leave again
+            if distance < depth_left and (distance > 0 or depth_left == 1):
+                phase1_path.append(i)
+                phase1(neo, nco, nsl, depth_left - 1, i)
+                phase1_path.pop()
+
+    eo = int(edge_orientation_coord(edge_ori))
+    co = int(corner_orientation_coord(corner_ori))
+    sl = int(slice_coord(edge_perm, m_slice))
+    first_depth = max(t.corner_slice[co * 495 + sl], t.edge_slice[eo * 495 + sl], t.corner_edge[co * 2048 + eo])
+    try:
+        for depth in range(first_depth, max_phase1_depth + 1):
+            if best is not None and depth >= len(best):
+                break
+            phase1(eo, co, sl, depth, None)
+        if best is None:
+            phase1_exhausted = True
+            for depth in range(first_depth, max_phase1_depth + 1):
+                phase1(eo, co, sl, depth, None)
+    except SearchDone:
+        pass
+
+    if stats is not None:
+        stats['nodes'] = stats.get('nodes', 0) + nodes
+        stats['raw_length'] = best_raw_length
+    return best
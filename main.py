@@ -1,14 +1,15 @@
+import os
 from rubiks_cube import *
 from map import MapRubiksCube
-from solve import solve
+from solve import solve, move_list_to_string
 import numpy as np
 
-def getCube_fromFile():
+def getCube_fromFile(path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "rubiks_data.txt")):
     """
     Read characters from file and covert into a np chararray, the data structure for the cube
+    :param path: the file map.read_cube writes, rubiks_data.txt next to this file by default
     :return: a numpy char array of the cube colors
     """
-    path = "C:/Users/rymar/PycharmProjects/SolveRubiks/rubiks_data.txt"
     infile = open(path, 'r')
     faces = np.chararray((6, 9), 1, True)
     for i, line in enumerate(infile):
@@ -37,6 +38,8 @@ print()
 #         print()
 #rubiks_cube.print_cube(cube)
 
-# Call solve function that outputs moves
-solve(cube)
+# Call solve function that returns the moves
+solve_stats = {}
+print(move_list_to_string(solve(cube, solve_stats)))
+print(str(solve_stats['optimized_length']) + " moves, " + str(solve_stats['raw_length']) + " before optimizing")
 
@@ -1,7 +1,204 @@
+import argparse
+import json
 import math
+import os
+import sys
+import threading
+import time
+from collections import deque
 import numpy as np
 import cv2
-import keyboard
+from rubiks_cube import string_to_faces
+try:
+    import keyboard
+except ImportError:
+    # keyboard needs root on linux, only read_cube uses it, the headless scan does not
+    keyboard = None
+
+image_extensions = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def build_color_lut(color_ranges, extra_color_ranges):
+    """
+    Precompute the colors of every possible HSV pixel, so a frame is classified with one lookup instead of
+    one inRange per color
+    :param color_ranges: dict of color name -> (lower HSV bound, upper HSV bound)
+    :param extra_color_ranges: dict of color name -> a second (lower, upper) bound for the same color
+    :return: tuple (np uint8 array of size 180 * 256 * 256 of bit masks, the pixel h, s, v is at
+             (h << 16) | (s << 8) | v and bit i is set where it is in the ranges of color_names[i], tuple of the
+             color names)
+    """
+    color_names = tuple(color_ranges)
+    assert len(color_names) <= 8
+    lut = np.zeros((180, 256, 256), dtype=np.uint8)
+    # The ranges overlap, a pixel keeps every color it is in so each color's mask is the one inRange gave
+    for i, name in enumerate(color_names):
+        for lower, upper in [color_ranges[name]] + ([extra_color_ranges[name]] if name in extra_color_ranges else []):
+            lut[lower[0]:upper[0] + 1, lower[1]:upper[1] + 1, lower[2]:upper[2] + 1] |= 1 << i
+    # Flat, a frame is looked up with one np.take instead of indexing with the three channels
+    return lut.reshape(-1), color_names
+
+
+def build_mask_BGR(color_names, BGR_color):
+    """
+    :param color_names: the color of each bit, see build_color_lut
+    :param BGR_color: dict of color name -> BGR
+    :return: np uint8 array of size 256, 3 of the BGR to show each bit mask in, the color of its lowest bit
+             since the first color wins where the ranges overlap, black for no color
+    """
+    mask_BGR = np.zeros((256, 3), dtype=np.uint8)
+    for mask in range(1, 256):
+        first = (mask & -mask).bit_length() - 1
+        if first < len(color_names):
+            mask_BGR[mask] = BGR_color[color_names[first]]
+    return mask_BGR
+
+
+class DropOldestQueue:
+    """
+    Bounded queue between two threads of the scanner. Putting into a full queue drops the oldest item, so
+    a slow consumer always gets the newest frame instead of a backlog of stale ones
+    """
+
+    def __init__(self, maxsize=2):
+        self.items = deque(maxlen=maxsize)
+        self.condition = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self.condition:
+            if len(self.items) == self.items.maxlen:
+                self.dropped += 1
+            self.items.append(item)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """
+        :param timeout: seconds to wait for an item
+        :return: the oldest item, None when there was none in time
+        """
+        with self.condition:
+            if not self.items:
+                self.condition.wait(timeout)
+            return self.items.popleft() if self.items else None
+
+
+class StageCounter:
+    """
+    Frames per second and latency of one stage of the scanner, over its last window frames
+    """
+
+    def __init__(self, window=30):
+        self.times = deque(maxlen=window)
+        self.latencies = deque(maxlen=window)
+        self.frames = 0
+        self.lock = threading.Lock()
+
+    def tick(self, latency):
+        """
+        Count a frame through the stage
+        :param latency: seconds the frame took
+        """
+        with self.lock:
+            self.times.append(time.perf_counter())
+            self.latencies.append(latency)
+            self.frames += 1
+
+    def fps(self):
+        with self.lock:
+            if len(self.times) < 2 or self.times[-1] == self.times[0]:
+                return 0.0
+            return (len(self.times) - 1) / (self.times[-1] - self.times[0])
+
+    def latency(self):
+        """
+        :return: mean seconds per frame over the window
+        """
+        with self.lock:
+            return sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+
+    def stats(self):
+        return {'frames': self.frames, 'fps': self.fps(), 'latency_ms': self.latency() * 1000}
+
+
+class FaceConsensus:
+    """
+    Rolling vote of each sticker over the last frames a face was read in, so a face is confirmed without a key
+    press. The face is confirmed once every sticker has read the same color for stable_frames frames in a row
+    and that color won at least min_confidence of the votes in the window. A misread frame then only delays
+    the confirmation instead of being confirmed
+    """
+
+    def __init__(self, window=10, stable_frames=5, min_confidence=0.8, max_missed=None):
+        """
+        :param window: number of frames each sticker is voted over
+        :param stable_frames: frames in a row every sticker must have read the same color
+        :param min_confidence: fraction of the window the color of every sticker must have won
+        :param max_missed: frames in a row without the face before its votes are dropped, window when None
+        """
+        self.history = deque(maxlen=window)
+        self.stable_frames = stable_frames
+        self.min_confidence = min_confidence
+        self.max_missed = window if max_missed is None else max_missed
+        self.missed = 0
+        # Centre color -> tuple (list of the 9 colors, list of the 9 confidences) of every face confirmed
+        self.confirmed = {}
+
+    def reset(self):
+        """
+        Drop the votes of the face being read
+        """
+        self.history.clear()
+        self.missed = 0
+
+    def stable_count(self):
+        """
+        :return: number of frames in a row, up to the last one, that read the same 9 colors
+        """
+        count = 0
+        for side in reversed(self.history):
+            if side != self.history[-1]:
+                break
+            count += 1
+        return count
+
+    def confidence(self, side):
+        """
+        :param side: list of 9 colors
+        :return: list of the fraction of the window each sticker read its color of side
+        """
+        return [sum(each[i] == side[i] for each in self.history) / len(self.history) for i in range(9)]
+
+    def update(self, side, expected=None):
+        """
+        Vote with the colors read in one frame
+        :param side: list of the 9 colors of the frame in the order of index_colored_squares, None when no face
+                     was found
+        :param expected: the centre the face must have, None for any face not confirmed yet
+        :return: tuple (list of the 9 colors, list of their confidences) when this frame confirms the face,
+                 else None
+        """
+        if side is None or side[4] == '?' or side[4] in self.confirmed or \
+                (expected is not None and side[4] != expected):
+            self.missed += 1
+            if self.missed > self.max_missed:
+                self.reset()
+            return None
+        self.missed = 0
+        if self.history and self.history[-1][4] != side[4]:
+            # Another face is in front of the camera, the votes were for the face before
+            self.reset()
+        self.history.append(list(side))
+
+        if self.stable_count() < self.stable_frames:
+            return None
+        confidence = self.confidence(side)
+        if min(confidence) < self.min_confidence:
+            return None
+        self.confirmed[side[4]] = (list(side), confidence)
+        self.reset()
+        return list(side), confidence
+
 
 class ColoredSquare:
     """
@@ -34,24 +231,46 @@ class MapRubiksCube:
                 'blue': ((90, 100, 100), (135, 255, 220)), 'red': ((160, 50, 50), (180, 255, 255)),
                 'orange': ((1, 10, 60), (24, 255, 255)), 'white': ((0, 0, 155), (180, 20, 255))}
 
-    # The data structure for the cube is a list of 6 lists, storing the colors of each side
-    cube = []
+    # Had issues with red and white detection, so added another range of color values for them
+    extra_color_ranges = {'red': ((0, 130, 130), (5, 255, 255)), 'white': ((85, 12, 245), (112, 195, 255))}
+
+    # HSV -> bit mask of the colors, see build_color_lut
+    color_lut, color_names = build_color_lut(color_ranges, extra_color_ranges)
+    # BGR of each bit mask, to show the classified frame
+    mask_BGR = build_mask_BGR(color_names, BGR_color)
 
     min_contour_area = 800
     max_contour_area = 4000
-    # OpenCV will detect contours not on the cube, therefore must filter some
-    # List containing the class of ColoredSquare
-    valid_contours = []
+
+    # The cube is held inside this window of the frame: x from, x to, y from, y to (FRAME is 480 tall, 640 wide)
+    roi = (170, 500, 75, 405)
+    # The window is shrunk by this factor before the grid is fitted, 1 keeps every pixel
+    roi_scale = 0.5
+    # Fraction of a sticker patch that must have the winning color for the grid reading to be trusted
+    min_patch_agreement = 0.6
 
     # ORDER of reading (must show the camera this order): B Orange, U Yellow, F Red, L Blue, R Green, D white
     sides = ('o', 'y', 'r', 'w', 'g', 'b')
 
-    currently_reading = 'o'
 
-    waiting_confirmation = False
 
-    all_sides_read = False
+    def __init__(self):
+        # The state of a scan belongs to each scanner, so several can scan at once in one process
+        # The data structure for the cube is a list of 6 lists, storing the colors of each side
+        self.cube = []
+        # Confidence of each sticker of the sides in cube confirmed by a FaceConsensus, see read_cube
+        self.face_confidence = []
+        # The ColoredSquares of the frame waiting for confirmation in read_cube. Only the thread showing the
+        # frames writes it, the processing thread hands every frame's squares over in the results queue
+        self.pending_squares = []
+        # The side read by fitting the grid, None when the contours were used
+        self.grid_side = None
+        # Stage name -> StageCounter of the last read_cube
+        self.counters = {}
 
+        self.currently_reading = self.sides[0]
+        self.waiting_confirmation = False
+        self.all_sides_read = False
 
 
 
@@ -66,8 +285,25 @@ class MapRubiksCube:
 
     def index_colored_squares(self, squares, currentside):
         """
+        Order the squares of the side being read, then move on to the next side
         :param squares: a list of class ColoredSquares
         :param currentside: a char specifying the color of side reading
+        :return: a list of the colors in the order of the legend in order_squares
+        """
+        side_list = self.order_squares(squares, currentside)
+
+        # Current side is index 4, middle square is always known
+        self.next_side()
+
+        return side_list
+
+
+
+    def order_squares(self, squares, currentside):
+        """
+        :param squares: a list of class ColoredSquares
+        :param currentside: a char specifying the color of side reading, None to use the middle square found
+                            ('?' when only 8 squares were found)
 
         We are given 9 detected colored squares. Sort them and create a list of chars representing the colors in order.
         (Based on legend)
@@ -114,23 +350,28 @@ class MapRubiksCube:
         # Append the colors in correct order
         side_list.append(squares[right_edge[0]].color[0])
         # Omit calculating middle because its already known
+        if currentside is None:
+            currentside = squares[middle_sorted[1][0]].color[0] if len(middle_sorted) == 3 else '?'
         side_list.append(currentside)
         side_list.append(squares[left_edge[0]].color[0])
 
         for i in range(3):
             side_list.append(squares[sorted_top[i][0]].color[0])
 
+        return side_list
 
-        # Current side is index 4, middle square is always known
-        # Update currently reading side to next side
+
+
+    def next_side(self):
+        """
+        Update currently reading side to next side
+        """
         index_of_current = self.sides.index(self.currently_reading)
         if index_of_current != len(self.sides) - 1:
             self.currently_reading = self.sides[index_of_current + 1]
         else:
             self.all_sides_read = True
 
-        return side_list
-
 
 
     def show_capture(self, frame, colored_squares):
@@ -184,12 +425,13 @@ class MapRubiksCube:
 
 
 
-    def filter_contour(self, cnt, perc_flexibility, color):
+    def filter_contour(self, cnt, perc_flexibility, color, valid_contours):
         """
         Attempt to filter all countours detected by openCV that aren't possible stickers.
         Contour must be a square, and have minimum and maxiumum area
         :param cnt: the contour read by the color mask
         :param perc_flexibility: The percent amount the height can vary from the width
+        :param valid_contours: list of the ColoredSquares found so far in the frame
         :return: place the contour in the valid list if it meets criteria
         """
         # Note this function can have numerous ways of filtering, these are just a few tests
@@ -213,9 +455,9 @@ class MapRubiksCube:
         y_centre = y + h // 2
 
         # FRAME is 480 tall, 640 wide
-        if not (170 <= x_centre <= 500):
+        if not (self.roi[0] <= x_centre <= self.roi[1]):
             return
-        if not (75 <= y_centre <= 405):
+        if not (self.roi[2] <= y_centre <= self.roi[3]):
             return
 
         aspect_ratio = w/h
@@ -224,7 +466,7 @@ class MapRubiksCube:
             return
 
         # Check if center is within another center of already found contours
-        for valid_cnt in self.valid_contours:
+        for valid_cnt in valid_contours:
             if (valid_cnt.x <= x + w // 2 <= valid_cnt.x + valid_cnt.width) and (valid_cnt.y <= y + h // 2 <= valid_cnt.y + valid_cnt.width):
                 return
 
@@ -239,87 +481,557 @@ class MapRubiksCube:
             return
 
         # Add a new ColoredSquare class to valid list if the countour makes it down this function this far
-        self.valid_contours.append(ColoredSquare(x, y, w, color))
+        valid_contours.append(ColoredSquare(x, y, w, color))
+
+
+
+    def classify_pixels(self, hsv):
+        """
+        :param hsv: the frame converted to HSV
+        :return: np uint8 array of the bit mask of the colors of every pixel, see build_color_lut
+        """
+        h, s, v = cv2.split(hsv)
+        # The bytes v, s, h, 0 of a pixel read as a little endian uint32 are its index in the table
+        index = cv2.merge([v, s, h, np.zeros_like(h)]).view('<u4')[..., 0]
+        return np.take(self.color_lut, index)
 
 
 
-    def read_cube(self):
+    def color_contours(self, masks):
+        """
+        Find the sticker contours of each color in turn, on the pixels that have its bit
+        :param masks: the bit mask of every pixel, from classify_pixels
+        :return: a list of (contour, color name), the contours of the first color first
+        """
+        contours = []
+        for i, color in enumerate(self.color_names):
+            # Left as the bit, erode, dilate and findContours only tell zero from not zero
+            mask = cv2.bitwise_and(masks, 1 << i)
+            mask = cv2.erode(mask, None, iterations=2)
+            mask = cv2.dilate(mask, None, iterations=2)
+            contours += [(cnt, color) for cnt in cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]]
+        return contours
+
+
+
+    def detect_squares(self, frame):
+        """
+        Classify the frame and keep the contours that can be stickers
+        :param frame: BGR image from the camera
+        :return: tuple (list of the ColoredSquares found, the bit mask image to show)
+        """
+        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+        masks = self.classify_pixels(hsv)
+
+        # A list of this frame only, the processing thread and the display thread never share it
+        valid_contours = []
+        for cnt, color in self.color_contours(masks):
+            self.filter_contour(cnt, 0.15, color, valid_contours)
+        return valid_contours, masks
+
+
+
+    def order_quad(self, points):
+        """
+        :param points: 4 corner points of a quadrilateral in any order
+        :return: np float32 array of the corners in the order top left, top right, bottom right, bottom left
+        """
+        points = np.asarray(points, dtype=np.float32).reshape(4, 2)
+        sums = points.sum(axis=1)
+        diffs = points[:, 1] - points[:, 0]
+        return np.array([points[sums.argmin()], points[diffs.argmin()], points[sums.argmax()], points[diffs.argmax()]],
+                        dtype=np.float32)
+
+
+
+    def fit_grid(self, masks):
+        """
+        Fit the 3 by 3 grid of the face to the colored pixels of the window
+        :param masks: the bit mask image of the window
+        :return: np float32 array of size 3, 3, 2 of the sticker centres in the window, row 0 on top, None when
+                 there is no face big enough
+        """
+        # Close the dark borders between the stickers, so the face is one blob
+        mask = (masks > 0).astype(np.uint8) * 255
+        size = max(3, int(15 * self.roi_scale)) | 1
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((size, size), np.uint8))
+        contours = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+        if not contours:
+            return None
+        face = max(contours, key=cv2.contourArea)
+        if cv2.contourArea(face) < 9 * self.min_contour_area * self.roi_scale ** 2:
+            return None
+
+        # A face seen at an angle is any quadrilateral, its 4 corners are found by simplifying the outline, the
+        # rotated bounding box is only used when the outline does not simplify to 4 corners
+        hull = cv2.convexHull(face)
+        for flexibility in (0.02, 0.04, 0.08):
+            quad = cv2.approxPolyDP(hull, flexibility * cv2.arcLength(hull, True), True)
+            if len(quad) <= 4:
+                break
+        if len(quad) != 4:
+            quad = cv2.boxPoints(cv2.minAreaRect(face))
+
+        # The homography takes the grid, 0..3 in both directions, onto the corners of the face
+        corners = self.order_quad(quad)
+        grid = np.array([(0, 0), (3, 0), (3, 3), (0, 3)], dtype=np.float32)
+        homography = cv2.getPerspectiveTransform(grid, corners)
+        centres = np.array([(col + 0.5, row + 0.5) for row in range(3) for col in range(3)], dtype=np.float32)
+        return cv2.perspectiveTransform(centres.reshape(-1, 1, 2), homography).reshape(3, 3, 2)
+
+
+
+    def sample_grid(self, frame, known_centre=True):
+        """
+        Fast path: read the 9 stickers by fitting a grid to the window instead of filtering every contour of
+        the frame. Only the window, shrunk by roi_scale, is classified
+        :param frame: BGR image from the camera
+        :param known_centre: put the side being read in the middle instead of the color sampled there
+        :return: tuple (list of 9 color chars in the order of index_colored_squares, list of the ColoredSquares
+                 to show), None when the grid could not be read and the contours have to be used
+        """
+        (x_from, x_to, y_from, y_to) = self.roi
+        window = frame[y_from:y_to, x_from:x_to]
+        if self.roi_scale != 1:
+            window = cv2.resize(window, None, fx=self.roi_scale, fy=self.roi_scale, interpolation=cv2.INTER_AREA)
+        masks = self.classify_pixels(cv2.cvtColor(window, cv2.COLOR_BGR2HSV))
+
+        centres = self.fit_grid(masks)
+        if centres is None:
+            return None
+
+        # Sample a patch half a sticker wide around each centre
+        sticker = np.linalg.norm(centres[0, 1] - centres[0, 0])
+        half = max(1, int(sticker / 4))
+        colors = [[None] * 3 for _ in range(3)]
+        squares = []
+        for row in range(3):
+            for col in range(3):
+                x, y = int(round(centres[row, col, 0])), int(round(centres[row, col, 1]))
+                patch = masks[max(y - half, 0):y + half + 1, max(x - half, 0):x + half + 1]
+                # A pixel in several ranges counts for each of its colors, the first color wins a tie
+                counts = [np.count_nonzero(patch & (1 << i)) for i in range(len(self.color_names))]
+                best = int(np.argmax(counts))
+                if counts[best] < self.min_patch_agreement * patch.size:
+                    return None
+                colors[row][col] = self.color_names[best]
+
+                # Back to frame coordinates, for show_capture
+                width = int(sticker / self.roi_scale * 0.8)
+                squares.append(ColoredSquare(int(x_from + x / self.roi_scale) - width // 2,
+                                             int(y_from + y / self.roi_scale) - width // 2, width, colors[row][col]))
+
+        # INDEX LEGEND of index_colored_squares counts from the bottom right, right to left then up
+        side_list = [colors[2 - i // 3][2 - i % 3][0] for i in range(9)]
+        # Middle square is always known
+        if known_centre:
+            side_list[4] = self.currently_reading
+        return side_list, squares
+
+
+
+    def process_frame(self, frame, use_grid=True, known_centre=True):
+        """
+        Read the stickers of one frame, the grid first and the contours of the whole frame when it fails
+        :param frame: BGR image from the camera
+        :param use_grid: try the grid first, False always uses the contours
+        :param known_centre: see sample_grid
+        :return: tuple (list of the ColoredSquares found, side list when the grid was read or None,
+                 image of the colors to show or None)
+        """
+        grid = self.sample_grid(frame, known_centre) if use_grid else None
+        if grid is not None:
+            side, squares = grid
+            return squares, side, None
+        # Operations on the frame, every pixel is classified in one pass
+        squares, masks = self.detect_squares(frame)
+        return squares, None, self.mask_BGR[masks]
+
+
+
+    def side_found(self, squares, side):
+        """
+        :return: True when a frame read enough stickers to ask for confirmation
+        """
+        # 8 is enough when reading white, we know the middle color
+        return side is not None or (len(squares) == 8 and self.currently_reading == 'w') or len(squares) == 9
+
+
+
+    def pipeline_stats(self):
+        """
+        :return: dict of stage name -> dict of its fps and latency, see StageCounter
+        """
+        return {name: counter.stats() for name, counter in self.counters.items()}
+
+
+
+    def read_cube(self, camera_index=0, consensus=None):
         """
         Take in all sides, read colors, create the proper ordered list
+        A capture thread reads the camera into a queue that drops the oldest frame when full, a processing
+        thread reads the stickers of the newest frame, and this thread shows the results and reads the keys.
+        A slow frame is then skipped instead of delaying every frame after it
+        :param camera_index: the cv2.VideoCapture index of the camera
+        :param consensus: optional FaceConsensus, each side is then confirmed by it instead of by the keys, so
+                          the cube is read by turning it through the sides. The middle square must be read,
+                          8 squares are not enough, and the confidences go to face_confidence
         :return: output the cube chars to a file
         """
+        if keyboard is None and consensus is None:
+            raise RuntimeError("read_cube needs the keyboard module (root on linux), use scan_frames to scan headless")
+        camera = cv2.VideoCapture(camera_index)
+        frames = DropOldestQueue(2)
+        results = DropOldestQueue(1)
+        self.counters = {'capture': StageCounter(), 'process': StageCounter(), 'display': StageCounter()}
+        stop = threading.Event()
+        # Results of frames captured before the last confirmation belong to the side before
+        resumed_at = [time.perf_counter()]
+
+        def capture():
+            while not stop.is_set():
+                start = time.perf_counter()
+                (grabbed, frame) = camera.read()
+                if not grabbed:
+                    time.sleep(0.01)
+                    continue
+                self.counters['capture'].tick(time.perf_counter() - start)
+                frames.put((start, frame))
+
+        def process():
+            while not stop.is_set():
+                item = frames.get(timeout=0.1)
+                if item is None or self.waiting_confirmation:
+                    continue
+                captured_at, frame = item
+                start = time.perf_counter()
+                # The consensus checks the middle square read is the side being read
+                squares, side, colors = self.process_frame(frame, known_centre=consensus is None)
+                self.counters['process'].tick(time.perf_counter() - start)
+                results.put((captured_at, frame, squares, side, colors))
+
+        threads = [threading.Thread(target=capture, daemon=True), threading.Thread(target=process, daemon=True)]
+        for thread in threads:
+            thread.start()
 
         last_frame_pressed = False
         detecting_release = False
-        camera = cv2.VideoCapture(0)
-        while not self.all_sides_read:
-            if not self.waiting_confirmation:
-                # Capture frame by frame
+        try:
+            while not self.all_sides_read:
+                if not self.waiting_confirmation:
+                    result = results.get(timeout=0.03)
+                    if result is not None and result[0] >= resumed_at[0]:
+                        (captured_at, frame, squares, side, colors) = result
+                        # The display latency is the age of the frame, capture to screen
+                        self.counters['display'].tick(time.perf_counter() - captured_at)
+                        if colors is not None:
+                            self.showFrame(colors, "Colors")
+
+                        if consensus is not None:
+                            if side is None and len(squares) == 9:
+                                side = self.order_squares(squares, None)
+                            confirmed = consensus.update(side, self.currently_reading)
+                            if confirmed is not None:
+                                self.cube.append(confirmed[0])
+                                self.face_confidence.append(confirmed[1])
+                                self.show_capture(frame.copy(), squares)
+                                self.next_side()
+                                resumed_at[0] = time.perf_counter()
+                            cv2.putText(frame, 'Stable: ' + str(consensus.stable_count()) +
+                                        '/' + str(consensus.stable_frames), (10, 110), cv2.FONT_HERSHEY_COMPLEX, 0.5,
+                                        (255, 255, 255))
+
+                        # Output the image showing colors analyzed and wait confirmation from user
+                        elif self.side_found(squares, side):
+                            self.pending_squares, self.grid_side = squares, side
+                            self.waiting_confirmation = True
+                            self.show_capture(frame.copy(), squares)
+
+                        # Display the resulting frame
+                        cv2.putText(frame, 'Currently Reading: ' + self.currently_reading, (10, 30), cv2.FONT_HERSHEY_COMPLEX, 0.5, (255, 255, 255))
+                        for row, (name, counter) in enumerate(self.counters.items()):
+                            cv2.putText(frame, name + ': ' + format(counter.fps(), '.1f') + ' fps ' +
+                                        format(counter.latency() * 1000, '.0f') + ' ms', (10, 50 + 20 * row),
+                                        cv2.FONT_HERSHEY_COMPLEX, 0.5, (255, 255, 255))
+                        self.showFrame(frame, "RAW")
+                else:
+                    # Keyboard interaction: If what the program detects are the wrong colors, space will reset
+                    #                       Else press '*' and it permanently captures the colors and move to next side
+                    if keyboard.is_pressed('space'):
+                        last_frame_pressed = True
+                        detecting_release = True
+                    elif detecting_release:
+                        last_frame_pressed = False
+
+                    if detecting_release and not last_frame_pressed:
+                        detecting_release = False
+                        if self.grid_side is not None:
+                            self.cube.append(self.grid_side)
+                            self.next_side()
+                        else:
+                            self.cube.append(
+                                self.index_colored_squares(self.pending_squares, currentside=self.currently_reading))
+                        resumed_at[0] = time.perf_counter()
+                        self.waiting_confirmation = False
+
+                    if keyboard.is_pressed('*'):
+                        resumed_at[0] = time.perf_counter()
+                        self.waiting_confirmation = False
+
+                # Exit program
+                if 'q' == chr(cv2.waitKey(1) & 255):
+                    break
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            camera.release()
+            cv2.destroyAllWindows()
+
+        # Write the cube to a file
+        write_cube(self.cube)
+
+
+
+    def scan_frames(self, frames, use_grid=True, consensus=None):
+        """
+        Headless scanning: run the detection on every frame as fast as it goes, without windows or keys.
+        The side being read does not change, the middle of each side is the color found there
+        :param frames: iterable of (name, BGR image), see read_frames
+        :param use_grid: try the grid first, False always uses filter_contour
+        :param consensus: optional FaceConsensus, only the frames that confirm a side are then given, with the
+                          'confidence' of each sticker
+        :return: generator of dicts, one per frame a side was found in: the frame name and number, the 'colors'
+                 in the order of index_colored_squares and the 'method' that found them
+        """
+        for number, (name, frame) in enumerate(frames):
+            squares, side, colors = self.process_frame(frame, use_grid, known_centre=False)
+            method = 'grid'
+            # A headless scan has no side being read, so 8 squares are never enough
+            if side is None and len(squares) == 9:
+                side, method = self.order_squares(squares, None), 'contours'
+            detection = {'frame': name, 'number': number}
+            if consensus is not None:
+                confirmed = consensus.update(side)
+                if confirmed is None:
+                    continue
+                side, detection['confidence'] = confirmed
+            elif side is None:
+                continue
+            detection.update({'colors': "".join(side), 'method': method})
+            yield detection
+
+
+def write_cube(sides, path='rubiks_data.txt'):
+    """
+    :param sides: the colors of each side, one line of the file per side
+    :param path: file to write, main.getCube_fromFile reads it
+    """
+    outfile = open(path, 'w')
+    for each_face in sides:
+        outfile.write("".join(each_face))
+        outfile.write("\n")
+    outfile.close()
+
+
+class MultiCameraScanner:
+    """
+    Read the sides of one cube from several cameras at once, for example three cameras that each see two
+    sides, instead of showing one camera the six sides in turn.
+    Every camera has its own thread, and every window of its frames that a side is seen in has its own
+    MapRubiksCube and FaceConsensus, so a camera seeing two sides reads both from each frame. The consensuses
+    share one dict of confirmed sides, so a side confirmed by one window is not confirmed again by another.
+    Each camera must see its sides turned the way read_cube asks for them, since the order of the stickers
+    depends on it
+    """
+
+    def __init__(self, sources, window=10, stable_frames=5, min_confidence=0.8, use_grid=True, rois=None):
+        """
+        :param sources: list of cv2.VideoCapture sources, camera indexes or video files
+        :param window: see FaceConsensus
+        :param stable_frames: see FaceConsensus
+        :param min_confidence: see FaceConsensus
+        :param use_grid: try the grid first, False always uses the contours
+        :param rois: optional list with the windows of each source, a list of (x from, x to, y from, y to) like
+                     MapRubiksCube.roi, one per side the source sees. Every window is read on every frame.
+                     MapRubiksCube.roi for each source when None
+        """
+        self.sources = list(sources)
+        self.use_grid = use_grid
+        self.rois = [[MapRubiksCube.roi] for _ in self.sources] if rois is None else [list(each) for each in rois]
+        if len(self.rois) != len(self.sources) or not all(self.rois):
+            raise ValueError("rois must give at least one window for each source")
+        # Centre color -> tuple (list of the 9 colors, list of the 9 confidences), shared by the consensuses
+        self.confirmed = {}
+        # Centre color -> source that confirmed the side
+        self.found_by = {}
+        # The scanners and consensuses of each source, one per window
+        self.scanners = [[MapRubiksCube() for _ in source_rois] for source_rois in self.rois]
+        for source_scanners, source_rois in zip(self.scanners, self.rois):
+            for scanner, roi in zip(source_scanners, source_rois):
+                scanner.roi = roi
+        self.consensus = [[FaceConsensus(window, stable_frames, min_confidence) for _ in source_rois]
+                          for source_rois in self.rois]
+        for consensus in sum(self.consensus, []):
+            consensus.confirmed = self.confirmed
+        self.counters = {str(source): StageCounter() for source in self.sources}
+        # Held while a consensus is updated, so two cameras can not both confirm a side
+        self.lock = threading.Lock()
+        self.all_sides_read = threading.Event()
+
+    def scan(self, index, stop):
+        """
+        Read one source until every side is confirmed, stop is set or a video file ends
+        :param index: index of the source in sources
+        :param stop: threading.Event
+        """
+        source = self.sources[index]
+        counter = self.counters[str(source)]
+        camera = cv2.VideoCapture(source)
+        try:
+            while not stop.is_set() and not self.all_sides_read.is_set():
                 (grabbed, frame) = camera.read()
+                if not grabbed:
+                    # The end of a video file, a camera can skip a frame
+                    if isinstance(source, str):
+                        break
+                    time.sleep(0.01)
+                    continue
+                start = time.perf_counter()
+                sides = []
+                for scanner in self.scanners[index]:
+                    squares, side, colors = scanner.process_frame(frame, self.use_grid, known_centre=False)
+                    if side is None and len(squares) == 9:
+                        side = scanner.order_squares(squares, None)
+                    sides.append(side)
+                counter.tick(time.perf_counter() - start)
+
+                with self.lock:
+                    for scanner, consensus, side in zip(self.scanners[index], self.consensus[index], sides):
+                        confirmed = consensus.update(side)
+                        if confirmed is None:
+                            continue
+                        scanner.cube.append(confirmed[0])
+                        scanner.face_confidence.append(confirmed[1])
+                        self.found_by[confirmed[0][4]] = source
+                    if len(self.confirmed) == len(MapRubiksCube.sides):
+                        self.all_sides_read.set()
+        finally:
+            camera.release()
+
+    def run(self, timeout=None):
+        """
+        Scan every source in parallel until the six sides are confirmed
+        :param timeout: seconds to give up after, None to wait until the sides are found or every source ended
+        :return: np chararray of size 6, 9 of the cube, see cube
+        """
+        stop = threading.Event()
+        threads = [threading.Thread(target=self.scan, args=(index, stop), daemon=True)
+                   for index in range(len(self.sources))]
+        for thread in threads:
+            thread.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            while not self.all_sides_read.wait(0.05):
+                if not any(thread.is_alive() for thread in threads):
+                    break
+                if deadline is not None and time.monotonic() > deadline:
+                    break
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        missing = [side for side in MapRubiksCube.sides if side not in self.confirmed]
+        if missing:
+            raise RuntimeError("Sides not found by any camera: " + ", ".join(missing))
+        return self.cube()
+
+    def cube(self):
+        """
+        :return: np chararray of size 6, 9 of the confirmed sides in the order of MapRubiksCube.sides, the face
+                 order of rubiks_cube
+        """
+        return string_to_faces("".join("".join(self.confirmed[side][0]) for side in MapRubiksCube.sides))
 
-                # Operations on the frame
-                blurred = cv2.GaussianBlur(frame, (5, 5), 0)
-                hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-
-                self.valid_contours = []
-
-                for key in self.color_ranges:
-                    # Analyze all color ranges
-                    new_mask = cv2.inRange(hsv, self.color_ranges[key][0], self.color_ranges[key][1])
-
-                    # Had issues with red and white detection, so added another range of color values for them
-                    if key == 'red':
-                        second_red = cv2.inRange(hsv, (0, 130, 130), (5, 255, 255))
-                        new_mask += second_red
-                    if key == 'white':
-                        second_white = cv2.inRange(hsv, (85, 12, 245), (112, 195, 255))
-                        new_mask += second_white
-
-                    new_mask = cv2.erode(new_mask, None, iterations=2)
-                    new_mask = cv2.dilate(new_mask, None, iterations=2)
-                    contours = cv2.findContours(new_mask.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
-                    self.showFrame(new_mask, key)
-                    for cnt in contours:
-                        self.filter_contour(cnt, 0.15, str(key))
-
-                    # If at 8 (we know the middle color) or 9 sticker colors detect detected, output the image showing colors analyzed
-                    # And wait confirmation from user
-                    if (len(self.valid_contours) == 8 and self.currently_reading == 'w') or len(self.valid_contours) == 9:
-                        self.waiting_confirmation = True
-                        self.show_capture(frame, self.valid_contours)
-
-
-                # Display the resulting frame
-                cv2.putText(frame, 'Currently Reading: ' + self.currently_reading, (10, 30), cv2.FONT_HERSHEY_COMPLEX, 0.5, (255, 255, 255))
-                self.showFrame(frame, "RAW")
-            else:
-                # Keyboard interaction: If what the program detects are the wrong colors, space will reset
-                #                       Else press '*' and it permanently captures the colors and move to next side
-                if keyboard.is_pressed('space'):
-                    last_frame_pressed = True
-                    detecting_release = True
-                elif detecting_release:
-                    last_frame_pressed = False
-
-                if detecting_release and not last_frame_pressed:
-                    detecting_release = False
-                    self.waiting_confirmation = False
-                    self.cube.append(
-                        self.index_colored_squares(self.valid_contours, currentside=self.currently_reading))
-
-                if keyboard.is_pressed('*'):
-                    self.waiting_confirmation = False
-
-            # Exit program
-            if 'q' == chr(cv2.waitKey(1) & 255):
-                break
+    def stats(self):
+        """
+        :return: dict of source -> dict of its fps and latency, and centre color -> source that confirmed it
+        """
+        return {'sources': {name: counter.stats() for name, counter in self.counters.items()},
+                'found_by': {side: str(source) for side, source in self.found_by.items()}}
 
-        camera.release()
-        cv2.destroyAllWindows()
 
-        # Write the cube to a file
-        outfile = open('rubiks_data.txt', 'w')
-        for each_face in self.cube:
-            outfile.write("".join(each_face))
-            outfile.write("\n")
-        outfile.close()
+def read_frames(path):
+    """
+    :param path: a video file, or a directory of images read in name order
+    :return: generator of (name, BGR image)
+    """
+    if os.path.isdir(path):
+        for file_name in sorted(os.listdir(path)):
+            if file_name.lower().endswith(image_extensions):
+                frame = cv2.imread(os.path.join(path, file_name))
+                if frame is not None:
+                    yield file_name, frame
+        return
+
+    video = cv2.VideoCapture(path)
+    if not video.isOpened():
+        raise ValueError("Can not open video " + path)
+    number = 0
+    try:
+        while True:
+            (grabbed, frame) = video.read()
+            if not grabbed:
+                break
+            yield str(number), frame
+            number += 1
+    finally:
+        video.release()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan cube faces from a video file or a directory of frames, "
+                                                 "one JSON line per face found, the throughput report on stderr")
+    parser.add_argument('input', help="video file or directory of images")
+    parser.add_argument('-o', '--output', default='-', help="file to write the JSON lines to, - for stdout")
+    parser.add_argument('--no-grid', action='store_true', help="only use the contours, not the grid fit")
+    parser.add_argument('--confirm', action='store_true',
+                        help="only write each side once, when its colors have been stable over several frames")
+    parser.add_argument('--window', type=int, default=10, help="frames each sticker is voted over with --confirm")
+    parser.add_argument('--stable-frames', type=int, default=5,
+                        help="frames in a row every sticker must read the same color with --confirm")
+    parser.add_argument('--min-confidence', type=float, default=0.8,
+                        help="fraction of the window the color of every sticker must win with --confirm")
+    args = parser.parse_args(argv)
+
+    scanner = MapRubiksCube()
+    consensus = FaceConsensus(args.window, args.stable_frames, args.min_confidence) if args.confirm else None
+    outfile = sys.stdout if args.output == '-' else open(args.output, 'w')
+    frames = {'count': 0}
+
+    def counted(source):
+        for item in source:
+            frames['count'] += 1
+            yield item
+
+    detections = {'grid': 0, 'contours': 0}
+    start = time.perf_counter()
+    try:
+        for detection in scanner.scan_frames(counted(read_frames(args.input)), not args.no_grid, consensus):
+            detections[detection['method']] += 1
+            outfile.write(json.dumps(detection) + "\n")
+    finally:
+        if outfile is not sys.stdout:
+            outfile.close()
+    seconds = time.perf_counter() - start
+
+    found = sum(detections.values())
+    report = {'frames': frames['count'], 'detections': found, 'by_method': detections, 'seconds': seconds,
+              'frames_per_sec': frames['count'] / seconds if seconds else 0.0,
+              'detections_per_sec': found / seconds if seconds else 0.0}
+    print(json.dumps(report), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+import atexit
+import multiprocessing
+import os
+import time
+from solve import *
+from instrumentation import emit, branching_factor
+
+# Parallel phase search
+# The search tree of a depth bound is split by its first moves, one subtree per task, over a pool of worker
+# processes. The first worker to find a solution sets a shared event and the others give up. Every task of
+# a bound has finished before the next bound starts, so the solution found is still the shortest.
+
+phase_searches = {phase.name: phase for phase in (phase1_search, phase2_search, phase3_search, phase4_search)}
+
+# The cancel event of this worker process
+worker_cancel = None
+
+
+def init_worker(cancel):
+    """
+    Pool initializer, keeps the shared cancel event and loads the distance tables once
+    :param cancel: multiprocessing Event set when a solution is found
+    """
+    global worker_cancel
+    worker_cancel = cancel
+    for phase in phase_searches.values():
+        phase.distance()
+
+
+def search_prefix(task):
+    """
+    :param task: tuple (phase name, start coordinate, prefix of move indexes, depth bound)
+    :return: tuple (list of move indexes or None, number of coordinates generated)
+    """
+    phase_name, start, prefix, bound = task
+    return subtree_search(phase_searches[phase_name], start, prefix, bound, stop=worker_cancel.is_set)
+
+
+class ParallelSearch:
+    """
+    A search strategy that runs on a pool of worker processes, started the first time it is used
+    """
+
+    def __init__(self, workers=None, prefix_length=2):
+        """
+        :param workers: number of worker processes, one per cpu when None
+        :param prefix_length: the number of first moves the tree is split by, 2 gives about 180 tasks
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.prefix_length = prefix_length
+        self.cancel = multiprocessing.Event()
+        self.pool = None
+
+    def start(self):
+        """
+        Start the worker processes if they are not running
+        """
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers, initializer=init_worker, initargs=(self.cancel,))
+
+    def close(self):
+        """
+        Stop the worker processes
+        """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def prefixes(self, phase, length):
+        """
+        :return: list of every canonical list of length move indexes of the phase
+        """
+        successors = phase_successors(phase)
+        prefixes = [[]]
+        for _ in range(length):
+            prefixes = [prefix + [i] for prefix in prefixes for i in successors[prefix[-1] if prefix else None]]
+        return prefixes
+
+    def __call__(self, phase, max_depth, faces, stats=None, observer=None, stop_time=None):
+        """
+        Same as ida_search, with the subtrees of every depth bound searched in parallel
+        :param phase: the SearchPhase to complete, one of phase_searches
+        :param max_depth: the max number of moves to solve the stage
+        :param faces: the original state of the cube given in a 2d list
+        :param stats: optional dict, 'nodes' is increased by the number of coordinates generated
+        :param observer: optional function given a 'depth' event dict after every depth bound, see instrumentation
+        :param stop_time: optional time.monotonic() value, the workers are cancelled once it passes
+        :return: a list of strings, None if there is no solution within max_depth or stop_time passed
+        """
+        distance = phase.distance()
+        start = phase.coordinate(faces)
+        if not 0 <= distance[start] <= max_depth:
+            return None
+        if distance[start] == 0:
+            return []
+
+        self.start()
+        solution = None
+        nodes = 0
+        previous_nodes = 0
+        for bound in range(distance[start], max_depth + 1):
+            bound_start, bound_nodes = time.perf_counter(), nodes
+            tasks = [(phase.name, start, prefix, bound) for prefix in self.prefixes(phase, min(self.prefix_length, bound))]
+            results = self.pool.imap_unordered(search_prefix, tasks)
+            timed_out = False
+            for _ in tasks:
+                try:
+                    timeout = None if stop_time is None or self.cancel.is_set() else max(stop_time - time.monotonic(), 0)
+                    path, task_nodes = results.next(timeout)
+                except multiprocessing.TimeoutError:
+                    # Out of time, cancel the workers and wait for them to hand their tasks back
+                    timed_out = True
+                    self.cancel.set()
+                    path, task_nodes = results.next()
+                nodes += task_nodes
+                if path is not None and solution is None:
+                    solution = [all_moves[i] for i in path]
+                    self.cancel.set()
+            # Every task of the bound has returned, none of them can see the event cleared early
+            self.cancel.clear()
+            emit(observer, {'event': 'depth', 'search': 'parallel', 'phase': phase.name, 'depth': bound,
+                            'nodes': nodes - bound_nodes, 'tasks': len(tasks),
+                            'branching': branching_factor(nodes - bound_nodes, previous_nodes),
+                            'seconds': time.perf_counter() - bound_start})
+            previous_nodes = nodes - bound_nodes
+            if solution is not None or timed_out:
+                break
+
+        if stats is not None:
+            stats['nodes'] = stats.get('nodes', 0) + nodes
+        return solution
+
+
+# The searches solve(faces, strategy='parallel') uses, one per number of worker processes asked for
+searches = {}
+
+
+def parallel_search(workers=None):
+    """
+    :param workers: number of worker processes, one per cpu when None
+    :return: the ParallelSearch with that many workers, its pool is kept for the next solves
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers not in searches:
+        searches[workers] = ParallelSearch(workers)
+    return searches[workers]
+
+
+def close_searches():
+    """
+    Stop the worker processes of every search
+    """
+    for search in searches.values():
+        search.close()
+
+
+atexit.register(close_searches)
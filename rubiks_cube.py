@@ -51,6 +51,22 @@ m_row = (3, 4, 5)
 d_row = (6, 7, 8)
 all_rows = (u_row, m_row, d_row)
 
+edges = (1, 3, 5, 7)
+corners = (0, 2, 6, 8)
+#                           0  1  2  3  4  5
+# Order of the faces given: B, U, F, D, R, L
+# Given the index of face,
+
+#               face index: {dict of edges to matching list index}]
+face_to_edges = {
+    0: {1: (3, 7), 3: (5, 3), 5: (4, 5), 7: (1, 1)},
+    1: {1: (0, 7), 3: (5, 1), 5: (4, 1), 7: (2, 1)},
+    2: {1: (1, 7), 3: (5, 5), 5: (4, 3), 7: (3, 1)},
+    3: {1: (2, 7), 3: (5, 7), 5: (4, 7), 7: (0, 1)},
+    4: {1: (1, 5), 3: (2, 5), 5: (0, 5), 7: (3, 5)},
+    5: {1: (1, 3), 3: (0, 3), 5: (2, 3), 7: (3, 3)}
+}
+
 
 
 #          0  1  2  3  4  5
@@ -86,9 +102,10 @@ sides_affected = {'U': [[2, 5, 0, 4], [u_row, u_row, d_row[::-1], u_row]], 'D':
                   'L': [[2, 3, 0, 1], [l_column, l_column, l_column, l_column]], 'R': [[2, 1, 0, 3], [r_column, r_column, r_column, r_column]]}
 
 
-def move(move_sequence, faces):
+def swap_move(move_sequence, faces):
     """
-    Given a string sequence of moves, apply them on the faces
+    Given a string sequence of moves, apply them on the faces by swapping the stickers one by one.
+    This is the reference implementation the permutation tables below are built from
     :param move_sequence: a list of string moves
     :param faces: teh np chararray of cube
     :return: np chararray of size 6, 9
@@ -129,18 +146,119 @@ def move(move_sequence, faces):
         #rotate_sides(side_indexes, sides_affected[move[0]][1], int(move[1]), faces)
 
 
+# Permutation move engine
+#---------------------------------------------------------------------------------------
+# Every face turn only moves stickers around, so each of the 18 moves is a fixed permutation
+# of the 54 stickers of the flattened cube. new_faces[i] = old_faces[permutation[i]]
 
+# Opposite faces never share a sticker, so turns of opposite faces commute
+opposite_faces = {'U': 'D', 'D': 'U', 'F': 'B', 'B': 'F', 'R': 'L', 'L': 'R'}
+face_order = 'UDFBRL'
 
+all_moves = ('U1', 'U2', 'U3', 'D1', 'D2', 'D3', 'F1', 'F2', 'F3', 'B1', 'B2', 'B3', 'R1', 'R2', 'R3', 'L1', 'L2', 'L3')
+move_index = {each_move: i for i, each_move in enumerate(all_moves)}
 
+identity_permutation = np.arange(54)
 
 
+def build_move_permutations():
+    """
+    Find the sticker permutation of every move by turning a cube labelled 0..53
+    :return: np int array of size 18, 54, row i is the permutation of all_moves[i]
+    """
+    permutations = np.empty((len(all_moves), 54), dtype=np.intp)
+    for i, each_move in enumerate(all_moves):
+        labels = np.arange(54).reshape(6, 9)
+        swap_move([each_move], labels)
+        permutations[i] = labels.reshape(54)
+    return permutations
 
 
+move_permutations = build_move_permutations()
 
 
+def compose_moves(move_sequence):
+    """
+    Compose a sequence of moves into the single permutation that applies all of them
+    :param move_sequence: a list of string moves
+    :return: np int array of length 54
+    """
+    permutation = identity_permutation
+    for each_move in move_sequence:
+        permutation = permutation[move_permutations[move_index[each_move]]]
+    return permutation
 
 
+def move(move_sequence, faces):
+    """
+    Given a string sequence of moves, apply them on the faces
+    :param move_sequence: a list of string moves
+    :param faces: the np chararray of cube, updated in place
+    :return: np chararray of size 6, 9
+    """
+    # Move sequence is defined as ['U1', 'U2', 'F3']
+    # The whole sequence is one gather over the flattened faces
+    flat = faces.reshape(54)
+    faces[...] = flat[compose_moves(move_sequence)].reshape(6, 9)
+    return faces
 
 
+# Batched states
+#---------------------------------------------------------------------------------------
+# A state is the flattened cube as 54 uint8 ascii codes of the sticker chars, so a whole
+# search layer of N cubes is one (N, 54) array and one gather moves all of them
 
 
+def faces_to_state(faces):
+    """
+    Flatten the cube into a state
+    :param faces: the np chararray of cube
+    :return: np uint8 array of length 54
+    """
+    return np.frombuffer(np.asarray(faces, dtype='S1').tobytes(), dtype=np.uint8).copy()
+
+
+def state_to_faces(state):
+    """
+    Turn a state back into the cube data structure
+    :param state: np uint8 array of length 54
+    :return: np chararray of size 6, 9
+    """
+    faces = np.chararray((6, 9), 1, True)
+    faces[...] = np.asarray(state, dtype=np.uint8).view('S1').reshape(6, 9)
+    return faces
+
+
+def move_batch(states, moves):
+    """
+    Apply a move to every state at once
+    :param states: np uint8 array of size N, 54
+    :param moves: a string move applied to all rows, or a length N array of per-row moves
+                  (string moves or indexes into all_moves)
+    :return: np uint8 array of size N, 54 holding the successors
+    """
+    if isinstance(moves, str):
+        return states[:, move_permutations[move_index[moves]]]
+
+    moves = np.asarray(moves)
+    if moves.dtype.kind in ('U', 'S', 'O'):
+        moves = np.array([move_index[str(each_move)] for each_move in moves], dtype=np.intp)
+    return np.take_along_axis(states, move_permutations[moves], axis=1)
+
+
+def string_to_faces(cube_string):
+    """
+    :param cube_string: the 54 sticker chars, face after face in the order B, U, F, D, R, L
+    :return: np chararray of size 6, 9
+    """
+    if len(cube_string) != 54:
+        raise ValueError("A cube is 54 stickers, got " + str(len(cube_string)))
+    return state_to_faces(np.frombuffer(cube_string.encode(), dtype=np.uint8))
+
+
+def faces_to_string(faces):
+    """
+    :param faces: the np chararray of cube
+    :return: the 54 sticker chars, face after face
+    """
+    return faces_to_state(faces).tobytes().decode()
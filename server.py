@@ -0,0 +1,195 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+from concurrent.futures import ProcessPoolExecutor
+from batch import load_tables, solve_cube_string
+
+# Solver service
+# A long running server so a scanning station does not pay python startup and the table load per cube.
+# Clients connect over a unix socket or a localhost port and send one 54 char cube string per line, the
+# server writes back one JSON line per cube in the same order. The solves run in a pool of worker processes
+# that load the tables when the server starts. Requests for a cube already being solved wait on that solve
+# instead of starting another, and past max_pending different cubes new requests are refused straight away.
+
+solved_cube = 'o' * 9 + 'y' * 9 + 'r' * 9 + 'w' * 9 + 'g' * 9 + 'b' * 9
+
+
+class Overloaded(RuntimeError):
+    """
+    Raised when the server already has max_pending cubes waiting on the pool
+    """
+
+
+class SolverService:
+    """
+    Solves cube strings in a process pool, sharing the result of concurrent requests for the same cube
+    """
+
+    def __init__(self, workers=None, max_pending=None, cache_path=None, transposition_capacity=None):
+        """
+        :param workers: number of worker processes, one per cpu when None
+        :param max_pending: most different cubes queued or being solved at once, 8 per worker when None
+        :param cache_path: optional sqlite file of a SolutionCache the workers look cubes up in
+        :param transposition_capacity: optional size of a TranspositionTable in each worker, see batch.load_tables
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 8 * self.workers
+        self.executor = ProcessPoolExecutor(self.workers, initializer=load_tables,
+                                            initargs=(cache_path, 'thistlethwaite', transposition_capacity))
+        # cube string -> future of its result, for the cubes in the pool
+        self.pending = {}
+        self.requests = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.failed = 0
+
+    async def start(self):
+        """
+        Start every worker and wait for them to load the tables, so the first requests are not slow
+        """
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.executor, solve_cube_string, (0, solved_cube))
+                               for _ in range(self.workers)])
+
+    async def solve(self, cube_string):
+        """
+        :param cube_string: 54 char cube string
+        :return: dict of the result, 'solution' and 'length' or 'error'
+        """
+        self.requests += 1
+        future = self.pending.get(cube_string)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            if len(self.pending) >= self.max_pending:
+                self.rejected += 1
+                raise Overloaded("Server overloaded, " + str(len(self.pending)) + " cubes pending, retry later")
+            future = asyncio.get_running_loop().run_in_executor(self.executor, solve_cube_string, (0, cube_string))
+            self.pending[cube_string] = future
+            future.add_done_callback(lambda done: self.forget(cube_string, done))
+        # A client hanging up must not cancel the solve the other requests for this cube wait on
+        result = dict(await asyncio.shield(future))
+        del result['index']
+        return result
+
+    def forget(self, cube_string, future):
+        """
+        Take a finished solve out of pending, whether it succeeded or failed, so the next request for the cube
+        starts a new one
+        """
+        if self.pending.get(cube_string) is future:
+            del self.pending[cube_string]
+        if future.cancelled() or future.exception() is not None:
+            self.failed += 1
+
+    def stats(self):
+        """
+        :return: dict of the counters since the server started
+        """
+        return {'workers': self.workers, 'pending': len(self.pending), 'max_pending': self.max_pending,
+                'requests': self.requests, 'coalesced': self.coalesced, 'rejected': self.rejected,
+                'failed': self.failed}
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    async def handle_request(self, line):
+        """
+        :param line: one request line, a cube string or 'stats'
+        :return: dict of the reply
+        """
+        if line == 'stats':
+            return self.stats()
+        try:
+            return await self.solve(line)
+        except Overloaded as error:
+            return {'cube': line, 'error': str(error), 'overloaded': True}
+        except Exception as error:
+            # A solve that failed in the pool is answered like an invalid cube, the connection goes on
+            return {'cube': line, 'error': type(error).__name__ + ": " + str(error)}
+
+    async def handle_client(self, reader, writer):
+        """
+        Answer the lines of one connection in order until the client closes it
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode(errors='replace').strip()
+                if not line:
+                    continue
+                reply = await self.handle_request(line)
+                writer.write((json.dumps(reply) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(service, socket_path=None, port=None):
+    """
+    Run the service until cancelled
+    :param service: a SolverService
+    :param socket_path: unix socket file to listen on
+    :param port: localhost port to listen on, used when there is no socket_path
+    """
+    await service.start()
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = await asyncio.start_unix_server(service.handle_client, path=socket_path)
+    else:
+        server = await asyncio.start_server(service.handle_client, host='127.0.0.1', port=port)
+    async with server:
+        await server.serve_forever()
+
+
+def request(cube_string, socket_path=None, port=8765, timeout=60):
+    """
+    Solve one cube on a running server, for a station that does not run its own event loop
+    :param cube_string: 54 char cube string
+    :param socket_path: unix socket file of the server
+    :param port: localhost port of the server, used when there is no socket_path
+    :param timeout: seconds to wait for the reply
+    :return: dict of the reply
+    """
+    if socket_path is not None:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(timeout)
+        connection.connect(socket_path)
+    else:
+        connection = socket.create_connection(('127.0.0.1', port), timeout=timeout)
+    with connection:
+        connection.sendall((cube_string + "\n").encode())
+        with connection.makefile('r') as replies:
+            return json.loads(replies.readline())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve cube solves over a unix socket or a localhost port")
+    parser.add_argument('--socket', default=None, help="unix socket file to listen on")
+    parser.add_argument('--port', type=int, default=8765, help="localhost port, used when there is no --socket")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="worker processes, default one per cpu")
+    parser.add_argument('--max-pending', type=int, default=None,
+                        help="most different cubes being solved before requests are refused, default 8 per worker")
+    parser.add_argument('--cache', default=None, help="sqlite file to cache solutions in")
+    parser.add_argument('--transposition', type=int, default=None,
+                        help="coordinates a transposition table in each worker keeps, its counters go on every reply")
+    args = parser.parse_args(argv)
+
+    service = SolverService(args.workers, args.max_pending, args.cache, args.transposition)
+    try:
+        asyncio.run(serve(service, args.socket, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,15 @@
+import os
+import tempfile
+import time
 import numpy as np
 import copy
 from rubiks_cube import *
+from coordinates import *
+from goals import *
+from transposition import *
+from symmetry import apply_symmetry, conjugate_move_list, inverse_symmetry, face_permutations, phase_symmetries, \
+    axis_symmetries, corner_orientation_conjugates, slice_conjugates, SymmetryReduction, ReducedTable
+from instrumentation import emit, branching_factor, profiling
 
 # Implementation of thislethwaites algorithm
 
@@ -10,22 +19,9 @@ get_opposite = {'r':'o', 'o':'r', 'y':'w', 'w':'y', 'g':'b', 'b':'g'}
 
 face_to_color = {'F': 'r', 'B':'o', 'U':'y', 'D':'w', 'R':'g', 'L':'b'}
 
+# Distance tables of the phases are saved here once built
+table_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tables')
 
-edges = (1, 3, 5, 7)
-corners = (0, 2, 6, 8)
-#                           0  1  2  3  4  5
-# Order of the faces given: B, U, F, D, R, L
-# Given the index of face,
-
-#               face index: {dict of edges to matching list index}]
-face_to_edges = {
-    0: {1: (3, 7), 3: (5, 3), 5: (4, 5), 7: (1, 1)},
-    1: {1: (0, 7), 3: (5, 1), 5: (4, 1), 7: (2, 1)},
-    2: {1: (1, 7), 3: (5, 5), 5: (4, 3), 7: (3, 1)},
-    3: {1: (2, 7), 3: (5, 7), 5: (4, 7), 7: (0, 1)},
-    4: {1: (1, 5), 3: (2, 5), 5: (0, 5), 7: (3, 5)},
-    5: {1: (1, 3), 3: (0, 3), 5: (2, 3), 7: (3, 3)}
-}
 
 def move_list_to_string(move_list):
     """
@@ -47,6 +43,54 @@ def move_list_to_string(move_list):
     return curr_string
 
 
+def optimize_moves(move_list):
+    """
+    Shorten a move list without changing what it does to the cube:
+    turns of the same face are merged (R1 R2 -> R3), turns that add up to nothing are removed, and
+    turns of opposite faces commute so R1 L1 R1 -> R2 L1
+    :param move_list: a list of string moves
+    :return: a new list of string moves
+    """
+    # Kept as [face, clockwise turns], the tail only ever holds one turn per face of the same axis
+    optimized = []
+    for each_move in move_list:
+        face, turns = each_move[0], int(each_move[1])
+
+        # The turns at the end on the same axis all commute with this one
+        axis_run = 0
+        while axis_run < len(optimized) and optimized[-1 - axis_run][0] in (face, opposite_faces[face]):
+            axis_run += 1
+        run = optimized[len(optimized) - axis_run:]
+
+        same_face = [turn for turn in run if turn[0] == face]
+        if same_face:
+            same_face[0][1] = (same_face[0][1] + turns) % 4
+            if same_face[0][1] == 0:
+                optimized.remove(same_face[0])
+        else:
+            optimized.append([face, turns])
+            # Keep the commuting pair in the canonical order
+            optimized[len(optimized) - axis_run - 1:] = sorted(optimized[len(optimized) - axis_run - 1:],
+                                                              key=lambda turn: face_order.index(turn[0]))
+
+    return [face + str(turns) for face, turns in optimized]
+
+
+
+# Criteria listed in phase1 function docstring
+# U and D edges can not be the colors below, B and F edges can not be L or R colors, R and L edges can not be F or B colors
+phase1_goal = StickerGoal(forbidden_colors(dict(
+    [((1, 1), 'o'), ((1, 5), 'rgb'), ((1, 7), 'ro'), ((1, 3), 'bg'),
+     ((3, 1), 'ro'), ((3, 3), 'bg'), ((3, 5), 'gb'), ((3, 7), 'or')] +
+    [((face, index), 'bg') for face in (0, 2) for index in edges] +
+    [((face, index), 'or') for face in (4, 5) for index in edges])))
+
+# We are complete phase 2 when all L and R corners are on their sides, can be on opposite,
+# and no L or R color is on the middle edges of the F, B, U, D sides
+lr_colors = face_to_color['L'] + face_to_color['R']
+phase2_goal = StickerGoal({(face, index): lr_colors for face in (4, 5) for index in corners}) & \
+    StickerGoal(forbidden_colors({(face, index): lr_colors for face in (0, 1, 2, 3) for index in (1, 7)}))
+
 
 def is_phase1_complete(faces):
     """
@@ -54,22 +98,7 @@ def is_phase1_complete(faces):
     :param faces: the cube list
     :return: True of False whether phase one is done
     """
-
-    # Criteria listed in phase1 function docstring
-
-    if faces[1][1] == 'o' or faces[1][5] == 'r' or faces[1][5] == 'g' or faces[1][5] == 'b' or faces[1][7] == 'r' or faces[1][7] == 'o' or faces[1][3] == 'b' or faces[1][3] == 'g':
-        return False
-    if faces[3][1] == 'r' or faces[3][3] == 'b' or faces[3][5] == 'g' or faces[3][7] == 'o' or faces[3][1] == 'o' or faces[3][3] == 'g' or faces[3][5] == 'b' or faces[3][7] == 'r':
-        return False
-    if (faces[0][1] == 'b' or faces[0][1] == 'g') or (faces[0][3] == 'b' or faces[0][3] == 'g') or (faces[0][5] == 'b' or faces[0][5] == 'g') or (faces[0][7] == 'b' or faces[0][7] == 'g'):
-        return False
-    if (faces[2][1] == 'b' or faces[2][1] == 'g') or (faces[2][3] == 'b' or faces[2][3] == 'g') or (faces[2][5] == 'b' or faces[2][5] == 'g') or (faces[2][7] == 'b' or faces[2][7] == 'g'):
-        return False
-    if (faces[4][1] == 'o' or faces[4][1] == 'r') or (faces[4][3] == 'o' or faces[4][3] == 'r') or (faces[4][5] == 'o' or faces[4][5] == 'r') or (faces[4][7] == 'o' or faces[4][7] == 'r'):
-        return False
-    if (faces[5][1] == 'o' or faces[5][1] == 'r') or (faces[5][3] == 'o' or faces[5][3] == 'r') or (faces[5][5] == 'o' or faces[5][5] == 'r') or (faces[5][7] == 'o' or faces[5][7] == 'r'):
-        return False
-    return True
+    return phase1_goal.check(faces)
 
 
 def is_phase2_complete(faces):
@@ -78,40 +107,45 @@ def is_phase2_complete(faces):
     :param faces: the cube list
     :return: True of False whether phase one is done
     """
-
-    """
-    We are complete phase 2 when all L and R corners are on their sides, can be on opposite
-    """
+    return phase2_goal.check(faces)
 
 
-    for corner_index in corners:
-        # Check L
-        if not (faces[5][corner_index] == face_to_color['L'] or faces[5][corner_index] == face_to_color['R']):
-            return False
-        if not (faces[4][corner_index] == face_to_color['L'] or faces[4][corner_index] == face_to_color['R']):
-            return False
 
-    middle_edges = (1, 7)
-    non_LR_sides = {'F': 2, 'B': 0, 'U': 1, 'D': 3}
-    for side in non_LR_sides:
-        side_list = faces[non_LR_sides[side]]
-        for edge in middle_edges:
-            if side_list[edge] == 'b' or side_list[edge] == 'g':
-                return False
 
+def can_follow(last_move, next_move, canonical=True):
+    """
+    Decide if a search should try next_move straight after last_move
+    :param last_move: string move, None at the start of the search
+    :param next_move: string move
+    :param canonical: also only search commuting opposite face turns in one order (U before D, F before B,
+                      R before L), U D and D U reach the same cube
+    :return: True of False
+    """
+    if last_move is None:
+        return True
+    # Turning the same face twice in a row is never shorter
+    if next_move[0] == last_move[0]:
+        return False
+    if canonical and opposite_faces[last_move[0]] == next_move[0]:
+        return face_order.index(last_move[0]) < face_order.index(next_move[0])
     return True
 
 
-
-
-def depth_search(omit_moves, max_depth, condition_func, faces):
+def depth_search(omit_moves, max_depth, condition_func, faces, canonical=True, stats=None, transposition=None,
+                 observer=None, stop_time=None):
     """
     Return the string of moves needed to solve the phase
     :param omit_moves: the banned moves for this stage
-    :param condition_func: boolean function to test if phase is satisfied
+    :param condition_func: boolean function testing a batch of states, size N, 54, if phase is satisfied
     :param max_depth: the max number of moves to solve the stage
     :param faces: the original state of the cube given in a 2d list
-    :return: a list of strings
+    :param canonical: search commuting opposite face turns in one order only, see can_follow
+    :param stats: optional dict, 'nodes' is increased by the number of cubes generated
+    :param transposition: optional TranspositionTable, cubes already reached at the same or a lower depth
+                          are not expanded again
+    :param observer: optional function given a 'depth' event dict after every depth, see instrumentation
+    :param stop_time: optional time.monotonic() value, no new depth is started after it
+    :return: a list of strings, None when stop_time passed first
     """
     phase_moves = np.array(
         ['U1', 'U2', 'U3', 'D1', 'D2', 'D3', 'F1', 'F2', 'F3', 'B1', 'B2', 'B3', 'R1', 'R2', 'R3', 'L1', 'L2', 'L3'])
@@ -120,94 +154,474 @@ def depth_search(omit_moves, max_depth, condition_func, faces):
     for omit_move in np.nditer(omit_moves):
         phase_moves = np.delete(phase_moves, np.argwhere(phase_moves == omit_move))
 
-    # Have a dictionary that has keys of each move, and the next depth moves to search as a value
-    new_depth_dict = {}
-    for each_move in phase_moves:
-        new_depth_dict[each_move] = np.array([m for m in phase_moves if m[0] != each_move[0]])
+    phase_move_indexes = np.array([move_index[m] for m in phase_moves], dtype=np.intp)
+
+    # Row is the last move, True in the columns of the moves allowed next
+    next_allowed = np.array([[can_follow(each_move, m, canonical) for m in phase_moves] for each_move in phase_moves])
+
+    # The whole depth layer is kept as arrays: the states, and the move list (indexes into phase_moves)
+    # that reached each state from the original faces
+    previous_states = faces_to_state(faces)[None]
+    previous_paths = np.empty((1, 0), dtype=np.intp)
+    last_moves = None
+    if transposition is not None:
+        transposition.seen(state_keys(previous_states)[0], 0)
+
+    peak_bytes = 0
+    for curr_depth in range(1, max_depth + 1):
+        if stop_time is not None and time.monotonic() > stop_time:
+            return None
+        depth_start = time.perf_counter()
+        if last_moves is None:
+            parents = np.zeros(len(phase_moves), dtype=np.intp)
+            children = np.arange(len(phase_moves))
+        else:
+            # Every (parent, next move) pair allowed, in the same order as expanding parents one by one
+            parents, children = np.nonzero(next_allowed[last_moves])
+
+        new_states = move_batch(previous_states[parents], phase_move_indexes[children])
+        new_paths = np.concatenate((previous_paths[parents], children[:, None]), axis=1)
+        if stats is not None:
+            stats['nodes'] = stats.get('nodes', 0) + len(new_states)
+
+        solved = np.flatnonzero(condition_func(new_states))
+        generated = len(new_states)
+        if not len(solved) and transposition is not None:
+            expand = transposition.filter(state_keys(new_states), curr_depth)
+            new_states, new_paths, children = new_states[expand], new_paths[expand], children[expand]
+
+        frontier_bytes = new_states.nbytes + new_paths.nbytes
+        peak_bytes = max(peak_bytes, frontier_bytes)
+        emit(observer, {'event': 'depth', 'search': 'depth_search', 'depth': curr_depth, 'nodes': generated,
+                        'goal_checks': generated, 'branching': branching_factor(generated, len(previous_states)),
+                        'seconds': time.perf_counter() - depth_start, 'frontier': len(new_states),
+                        'frontier_bytes': frontier_bytes, 'peak_bytes': peak_bytes})
+        if len(solved):
+            return [str(phase_moves[i]) for i in new_paths[solved[0]]]
+
+        previous_states = new_states
+        previous_paths = new_paths
+        last_moves = children
+
+
+class SearchPhase:
+    """
+    A phase of the solve as one int coordinate, searched with IDA*
+    The distance table of the coordinate is built the first time it is needed
+    """
+
+    def __init__(self, name, banned, size, coordinate_func, move_func, goal_coords, reduction=None):
+        """
+        :param name: name of the phase, also the file name its distance table is saved under
+        :param banned: list of the moves not allowed in the phase
+        :param size: number of values the coordinate can take
+        :param coordinate_func: function faces -> int coordinate
+        :param move_func: function (coordinates, move index) -> coordinates after the move, works on np arrays
+        :param goal_coords: list of the coordinates that complete the phase
+        :param reduction: optional SymmetryReduction, the table is then built and saved with one entry per
+                          symmetry class, from symmetries that keep the moves and the goal of the phase
+        """
+        self.name = name
+        self.banned = banned
+        self.move_indexes = [move_index[m] for m in all_moves if m not in banned]
+        self.size = size
+        self.coordinate = coordinate_func
+        self.move = move_func
+        self.goal_coords = goal_coords
+        self.reduction = reduction
+        self.distance_table = None
+
+    def build_table(self):
+        """
+        :return: np int8 array of the distance table as it is saved, reduced by symmetry when there is a reduction
+        """
+        if self.reduction is None:
+            return build_distance_table(self.size, self.goal_coords, self.move, self.move_indexes)
+        return build_distance_table(self.reduction.size, self.reduction.reduce(self.goal_coords),
+                                    self.reduction.move_func(self.move), self.move_indexes)
+
+    def distance(self):
+        """
+        Load the distance table from the tables directory, building and saving it if it is not there
+        :return: np int8 array, the fewest moves from each coordinate to the goal, a ReducedTable indexed the same
+                 way when there is a reduction
+        """
+        if self.distance_table is None:
+            # A reduced table is saved under its own name, so a full table saved before is not read as one
+            path = os.path.join(table_directory, self.name + ('_sym' if self.reduction is not None else '') + '.npy')
+            size = self.size if self.reduction is None else self.reduction.size
+            try:
+                table = np.load(path)
+            except (OSError, ValueError, EOFError):
+                # Not built yet, or not readable
+                table = None
+            # A table of another length was saved before the coordinate changed
+            if table is None or table.shape != (size,):
+                table = self.build_table()
+                save_table(path, table)
+            # The searches look the raw coordinates up, each is reduced to its class as it is looked up
+            if self.reduction is not None:
+                table = ReducedTable(table, self.reduction)
+            self.distance_table = table
+        return self.distance_table
+
+
+def save_table(path, table):
+    """
+    Save a distance table where other processes may be loading it. The table is written to a file of its own
+    and renamed into place, so it is never read half written
+    :param path: the .npy file
+    :param table: np array
+    """
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temporary = tempfile.mkstemp(suffix='.npy', dir=os.path.dirname(path))
+    except OSError:
+        # Read only install, the table is rebuilt next time
+        return
+    try:
+        with os.fdopen(handle, 'wb') as table_file:
+            np.save(table_file, table)
+        os.replace(temporary, path)
+    except OSError:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def phase1_coordinate(faces):
+    """
+    :return: the edge orientation of the faces
+    """
+    return int(edge_orientation_coord(faces_to_cubies(faces)[3]))
+
+
+def phase1_move(coords, i):
+    """
+    :return: the edge orientation after move i
+    """
+    return edge_orientation_move[coords, i]
+
+
+def phase2_coordinate(faces):
+    """
+    :return: the corner orientation and M slice position of the faces packed into one int
+    """
+    corner_perm, corner_ori, edge_perm, edge_ori = faces_to_cubies(faces)
+    return int(corner_orientation_coord(corner_ori)) * 495 + int(slice_coord(edge_perm, m_slice))
+
+
+def phase2_move(coords, i):
+    """
+    :return: the phase 2 coordinate after move i
+    """
+    return corner_orientation_move[coords // 495, i] * 495 + slice_move[coords % 495, i]
 
-    new_depth_moves_len = {}
-    for each_move2 in new_depth_dict:
-        new_depth_moves_len[each_move2] = len(new_depth_dict[each_move2])
 
-    # Initialize starting depth
-    phase_move_data = np.ndarray((len(phase_moves), 2), dtype=object)
+def phase3_coordinate(faces):
+    """
+    :return: the corner permutation and the E slice position among the non M slice positions packed into one int
+    """
+    corner_perm, corner_ori, edge_perm, edge_ori = faces_to_cubies(faces)
+    return int(permutation_coord(corner_perm)) * 70 + int(g2_e_slice_index[slice_coord(edge_perm, e_slice)])
 
-    for i in range(len(phase_moves)):
-        phase_move_data[i][0] = [phase_moves[i]]
-        phase_move_data[i][1] = np.array(faces)
-        move(phase_move_data[i][0], phase_move_data[i][1])
 
+def phase3_move(coords, i):
+    """
+    :return: the phase 3 coordinate after move i
+    """
+    e_slice_coords = slice_move[g2_e_slice_coords[coords % 70], i]
+    return corner_permutation_move[coords // 70, i] * 70 + g2_e_slice_index[e_slice_coords]
 
-        if condition_func(phase_move_data[i][1]):
-            return phase_move_data[i][0]
 
+def phase4_coordinate(faces):
+    """
+    :return: the corner permutation (one of the 96 half turns reach) and the order of the edges in
+             each slice packed into one int
+    """
+    corner_perm, corner_ori, edge_perm, edge_ori = faces_to_cubies(faces)
+    slice_perms = [int(slice_permutation_coord(edge_perm, edges_of_slice)) for edges_of_slice in (m_slice, e_slice, s_slice)]
+    return int(half_turn_corner_index[permutation_coord(corner_perm)]) * 13824 + \
+        slice_perms[0] * 576 + slice_perms[1] * 24 + slice_perms[2]
 
-    previous_depth = phase_move_data
 
-    # Now starting at depth 2 search
-    for curr_depth in range(2, max_depth + 1):
-        print("Calculating Depth " + str(curr_depth))
-        new_depth_moves = np.empty((0, 2), dtype=object)
+def phase4_move(coords, i):
+    """
+    :return: the phase 4 coordinate after move i
+    """
+    corner_perms = corner_permutation_move[half_turn_corner_perms[coords // 13824], i]
+    return half_turn_corner_index[corner_perms] * 13824 + \
+        slice_permutation_move[m_slice][coords // 576 % 24, i] * 576 + \
+        slice_permutation_move[e_slice][coords // 24 % 24, i] * 24 + \
+        slice_permutation_move[s_slice][coords % 24, i]
+
+
+# Phase 1: orient all edges. Phase 2: orient all corners and put the M slice edges in the M slice
+# Phase 3: every edge into its slice and the corners into a half turn permutation. Phase 4: solve with half turns
+phase1_search = SearchPhase('phase1', ['U2', 'D2'], 2048, phase1_coordinate, phase1_move, [0])
+# Phase 2 keeps its moves, its goal and what corner orientation means under the 8 symmetries that keep each axis
+phase2_symmetries = [s for s in phase_symmetries(['U1', 'U3', 'D1', 'D3']) if s in axis_symmetries('L')]
+phase2_search = SearchPhase('phase2', ['U1', 'U3', 'D1', 'D3'], 2187 * 495, phase2_coordinate, phase2_move,
+                            [solved_slice[m_slice]],
+                            SymmetryReduction(corner_orientation_conjugates(phase2_symmetries),
+                                              slice_conjugates(phase2_symmetries)))
+phase3_search = SearchPhase('phase3', ['U1', 'U3', 'D1', 'D3', 'F1', 'F3', 'B1', 'B3'], 40320 * 70,
+                            phase3_coordinate, phase3_move,
+                            half_turn_corner_perms * 70 + g2_e_slice_index[solved_slice[e_slice]])
+phase4_search = SearchPhase('phase4', [m for m in all_moves if m[1] != '2'], 96 * 13824, phase4_coordinate,
+                            phase4_move, [half_turn_corner_index[0] * 13824])
+
+
+def phase_successors(phase, canonical=True):
+    """
+    :param phase: the SearchPhase searched
+    :param canonical: search commuting opposite face turns in one order only, see can_follow
+    :return: dict of last move index (None at the start) -> list of the move indexes to try next
+    """
+    return {last: [i for i in phase.move_indexes
+                   if can_follow(None if last is None else all_moves[last], all_moves[i], canonical)]
+            for last in [None] + phase.move_indexes}
 
-        for x in np.nditer(previous_depth, flags=['external_loop', 'refs_ok'], order='F'):
-            for move_list in np.nditer(x, ['refs_ok']):
-                last_move_str = move_list.tolist()[-1]
 
-                new_str_moves = new_depth_dict[last_move_str] # list of str moves
-                next_depth_moves = np.ndarray((new_depth_moves_len[last_move_str], 2), dtype=object)
+def subtree_search(phase, start, prefix, bound, canonical=True, stop=None, transposition=None, stats=None):
+    """
+    Depth first search of only the move lists starting with prefix, looking for a solution of exactly
+    bound moves. ida_search searches every depth bound with no prefix, the parallel search hands one
+    prefix to each worker
+    :param phase: the SearchPhase to complete
+    :param start: the phase coordinate of the cube
+    :param prefix: list of move indexes every move list searched starts with
+    :param bound: the number of moves of the solutions looked for
+    :param canonical: search commuting opposite face turns in one order only, see can_follow
+    :param stop: optional function called every 1024 nodes, the search gives up once it returns True
+    :param transposition: optional TranspositionTable keyed on the coordinate, a coordinate already reached at
+                          the same or a lower depth is not searched again
+    :param stats: optional dict, 'goal_checks' is increased by the number of move lists of bound moves checked
+    :return: tuple (list of move indexes or None, number of coordinates generated)
+    """
+    distance = phase.distance()
+    successors = phase_successors(phase, canonical)
+    coord = start
+    for i in prefix:
+        coord = phase.move(coord, i)
+    if distance[coord] > bound - len(prefix):
+        return None, len(prefix)
+
+    path = list(prefix)
+    nodes = len(prefix)
+    goal_checks = 0
+    # Checking every node would cost more than the search
+    next_check = nodes + 1024
+
+    def search(coord, depth_left, last):
+        nonlocal nodes, goal_checks, next_check
+        if depth_left == 0:
+            goal_checks += 1
+            return distance[coord] == 0
+        if stop is not None and nodes >= next_check:
+            next_check = nodes + 1024
+            if stop():
+                raise InterruptedError
+        for i in successors[last]:
+            next_coord = phase.move(coord, i)
+            nodes += 1
+            if transposition is not None and transposition.seen(int(next_coord), bound - depth_left + 1):
+                continue
+            if distance[next_coord] < depth_left:
+                path.append(i)
+                if search(next_coord, depth_left - 1, i):
+                    return True
+                path.pop()
+        return False
 
-                for index, next_move in np.ndenumerate(new_str_moves):
-                    new_move_list = move_list.tolist() + [next_move]
-                    next_depth_moves[index][0] = new_move_list
-                    next_depth_moves[index][1] = np.array(faces)
-                    move(new_move_list, next_depth_moves[index][1])
+    try:
+        found = search(coord, bound - len(prefix), prefix[-1] if prefix else None)
+    except InterruptedError:
+        found = False
+    if stats is not None:
+        stats['goal_checks'] = stats.get('goal_checks', 0) + goal_checks
+    return (path if found else None), nodes
 
-                    if condition_func(next_depth_moves[index][1]):
-                        return next_depth_moves[index][0]
-                new_depth_moves = np.concatenate((new_depth_moves, next_depth_moves))
 
+def ida_search(phase, max_depth, faces, canonical=True, stats=None, transposition=None, observer=None,
+               stop_time=None):
+    """
+    Iterative deepening A*, return the shortest list of moves that completes the phase
+    Only the current move list is kept in memory, the distance table prunes every branch that can
+    not reach the goal within the depth bound
+    :param phase: the SearchPhase to complete
+    :param max_depth: the max number of moves to solve the stage
+    :param faces: the original state of the cube given in a 2d list
+    :param canonical: search commuting opposite face turns in one order only, see can_follow
+    :param stats: optional dict, 'nodes' is increased by the number of coordinates generated
+    :param transposition: optional TranspositionTable keyed on the coordinate, within one depth bound a
+                          coordinate already reached at the same or a lower depth is not searched again
+    :param observer: optional function given a 'depth' event dict after every depth bound, see instrumentation
+    :param stop_time: optional time.monotonic() value, the search gives up soon after it
+    :return: a list of strings, None if there is no solution within max_depth or stop_time passed
+    """
+    distance = phase.distance()
+    start = phase.coordinate(faces)
+    if not 0 <= distance[start] <= max_depth:
+        return None
+
+    stop = None if stop_time is None else lambda: time.monotonic() > stop_time
+    solution = None
+    nodes = 0
+    previous_nodes = 0
+    for bound in range(distance[start], max_depth + 1):
+        if transposition is not None:
+            transposition.clear()
+        bound_start, bound_stats = time.perf_counter(), {}
+        path, bound_nodes = subtree_search(phase, start, [], bound, canonical, stop, transposition, bound_stats)
+        nodes += bound_nodes
+        if path is None and stop is not None and stop():
+            break
+        emit(observer, {'event': 'depth', 'search': 'ida', 'phase': phase.name, 'depth': bound,
+                        'nodes': bound_nodes, 'goal_checks': bound_stats['goal_checks'],
+                        'branching': branching_factor(bound_nodes, previous_nodes),
+                        'seconds': time.perf_counter() - bound_start})
+        previous_nodes = bound_nodes
+        if path is not None:
+            solution = [all_moves[i] for i in path]
             break
-        previous_depth = new_depth_moves
 
+    if stats is not None:
+        stats['nodes'] = stats.get('nodes', 0) + nodes
+    return solution
 
 
-    # curr_depth = 2
-    # while curr_depth <= max_depth:
-    #     next_phase_data = np.ndarray((, 2), dtype=object)
-    #     # Create new phase moves
-    #     for x in np.ndi
-    #     # Check the phase move
+def inverse_move(i):
+    """
+    :param i: index into all_moves
+    :return: index into all_moves of the move undoing it
+    """
+    return move_index[all_moves[i][0] + str(4 - int(all_moves[i][1]))]
 
 
+def bidirectional_search(phase, max_depth, faces, stats=None, observer=None, stop_time=None):
+    """
+    Meet in the middle: grow breadth first layers of phase coordinates out from the cube and back from the
+    goal, always growing the side with the smaller frontier, until the two sides share a coordinate.
+    Each side only goes about half the depth and no distance table is needed
+    :param phase: the SearchPhase to complete, its moves must be closed under inverse
+    :param max_depth: the max number of moves to solve the stage
+    :param faces: the original state of the cube given in a 2d list
+    :param stats: optional dict, 'nodes' is increased by the number of coordinates generated
+    :param observer: optional function given a 'depth' event dict after every layer, see instrumentation
+    :param stop_time: optional time.monotonic() value, no new layer is started after it
+    :return: a list of strings, None if there is no solution within max_depth or stop_time passed
+    """
+    start = np.array([phase.coordinate(faces)], dtype=np.intp)
+    goals = np.unique(np.asarray(phase.goal_coords, dtype=np.intp))
+    if np.isin(start, goals).any():
+        return []
+
+    phase_moves = np.array(phase.move_indexes, dtype=np.intp)
+    # Each side is its list of layers (coordinates, index of the parent in the layer before, move from the
+    # parent) and the sorted array of every coordinate it has reached
+    forward = {'layers': [(start, None, None)], 'seen': start}
+    backward = {'layers': [(goals, None, None)], 'seen': goals}
+    nodes = 0
+    peak_bytes = 0
+
+    def trace(side, depth, index):
+        # Moves from the root of the side to one coordinate
+        path = []
+        while depth > 0:
+            coords, parents, layer_moves = side['layers'][depth]
+            path.append(int(layer_moves[index]))
+            index = parents[index]
+            depth -= 1
+        return path[::-1]
+
+    def layer_index(side, coord):
+        for depth, (coords, parents, layer_moves) in enumerate(side['layers']):
+            found = np.flatnonzero(coords == coord)
+            if len(found):
+                return depth, found[0]
+
+    solution = None
+    while solution is None and len(forward['layers']) + len(backward['layers']) - 2 < max_depth:
+        side, other = (forward, backward) if len(forward['layers'][-1][0]) <= len(backward['layers'][-1][0]) \
+            else (backward, forward)
+        frontier = side['layers'][-1][0]
+        if not len(frontier) or (stop_time is not None and time.monotonic() > stop_time):
+            break
+
+        layer_start = time.perf_counter()
+        reached = phase.move(frontier[:, None], phase_moves[None, :]).ravel()
+        nodes += len(reached)
+        generated = len(reached)
+        reached, first = np.unique(reached, return_index=True)
+        new = ~np.isin(reached, side['seen'], assume_unique=True)
+        reached, first = reached[new], first[new]
+        side['layers'].append((reached, first // len(phase_moves), phase_moves[first % len(phase_moves)]))
+        side['seen'] = np.union1d(side['seen'], reached)
+
+        met = np.flatnonzero(np.isin(reached, other['seen'], assume_unique=True))
+        memory = sum(part.nbytes for each in (forward, backward) for layer in each['layers'] for part in layer
+                     if part is not None) + forward['seen'].nbytes + backward['seen'].nbytes
+        peak_bytes = max(peak_bytes, memory)
+        emit(observer, {'event': 'depth', 'search': 'bidirectional', 'phase': phase.name,
+                        'side': 'forward' if side is forward else 'backward',
+                        'depth': len(forward['layers']) + len(backward['layers']) - 2, 'nodes': generated,
+                        'goal_checks': len(reached), 'branching': branching_factor(generated, len(frontier)),
+                        'seconds': time.perf_counter() - layer_start, 'frontier': len(reached),
+                        'frontier_bytes': memory, 'peak_bytes': peak_bytes})
+        if len(met):
+            # The meeting coordinate closest to the root of the other side gives the shortest solution
+            depth = len(side['layers']) - 1
+            other_depth, other_index, index = min((layer_index(other, reached[i]) + (i,) for i in met),
+                                                  key=lambda found: found[0])
+            if side is forward:
+                forward_path = trace(forward, depth, index)
+                backward_path = trace(backward, other_depth, other_index)
+            else:
+                forward_path = trace(forward, other_depth, other_index)
+                backward_path = trace(backward, depth, index)
+            # The backward side turned the goal into the meeting coordinate, undo its moves in reverse
+            solution = [all_moves[i] for i in forward_path] + \
+                [all_moves[inverse_move(i)] for i in backward_path[::-1]]
+
+    if stats is not None:
+        stats['nodes'] = stats.get('nodes', 0) + nodes
+    return solution
+
+
+def parallel_strategy(phase, max_depth, faces, stats=None, observer=None, stop_time=None, workers=None):
+    """
+    Search the phase on several cores, see parallel.ParallelSearch
+    :param workers: number of worker processes, one per cpu when None
+    """
+    # parallel imports this module, so it is only imported once it is used
+    import parallel
+    return parallel.parallel_search(workers)(phase, max_depth, faces, stats, observer, stop_time)
 
 
-            # Add each move
+# Ways to search a phase, all return the shortest solution
+search_strategies = {'ida': ida_search, 'bidirectional': bidirectional_search, 'parallel': parallel_strategy}
 
-    # # Loop until current depth reaches max depth
-    # for curr_depth in range(1, max_depth + 1):
-    #     # Test all moves
-    #     for move_sequence in all_moves: # This move is a list of a sequence of moves
-    #         # Perform move rotations
-    #         # Return the sequence if it solves the stage
-    #         if condition_func(move(move_sequence, faces)) == True:
-    #             return move_sequence
-    #
-    #     # Add new depth moves
-    #     if curr_depth < max_depth:
-    #         # moves_list = [[(1, 'U'), (1, 'D')], [(1, 'U'), (3, 'D')], [(3, 'U'), (1, 'D')], [(3, 'U'), (3, 'D')]]
-    #         new_moves_list = []
-    #         for move_sequence in all_moves:
-    #             add_moves = new_permissible_moves(omit_moves, move_sequence[-1])
-    #
-    #             for i in range(len(add_moves)):
-    #                 new_sequence = []
-    #                 new_sequence += move_sequence
-    #                 new_sequence.append(add_moves[i])
-    #                 new_moves_list.append(new_sequence)
-    #
-    #         all_moves = []
-    #         all_moves += new_moves_list
-    #         print("Increased to depth" + str(curr_depth))
+
+def search_phase(strategy, phase, max_depth, faces, stats=None, observer=None, stop_time=None, transposition=None,
+                 workers=None):
+    """
+    Search a phase with one of search_strategies
+    :param strategy: key of search_strategies
+    :param transposition: optional TranspositionTable, only the ida strategy takes one
+    :param workers: number of worker processes of the parallel strategy, one per cpu when None
+    :return: see ida_search
+    """
+    if transposition is not None and strategy != 'ida':
+        raise ValueError("Only the ida strategy uses a transposition table")
+    if workers is not None and strategy != 'parallel':
+        raise ValueError("Only the parallel strategy has worker processes")
+    if strategy == 'parallel':
+        return parallel_strategy(phase, max_depth, faces, stats, observer, stop_time, workers)
+    if transposition is None:
+        return search_strategies[strategy](phase, max_depth, faces, stats=stats, observer=observer,
+                                           stop_time=stop_time)
+    return ida_search(phase, max_depth, faces, stats=stats, transposition=transposition, observer=observer,
+                      stop_time=stop_time)
 
 
 def new_permissible_moves(omit_moves, last_move):
@@ -229,9 +643,16 @@ def new_permissible_moves(omit_moves, last_move):
 
 
 
-def phase1(faces):
+def phase1(faces, strategy='ida', stats=None, observer=None, stop_time=None, transposition=None,
+           workers=None):
     """
     Objective is to orient all edge pieces correctly
+    :param strategy: key of search_strategies
+    :param stats: optional dict given to the search
+    :param observer: optional function given the events of the search, see instrumentation
+    :param stop_time: optional time.monotonic() value the search gives up after, it then returns None
+    :param transposition: optional TranspositionTable, see search_phase
+    :param workers: number of worker processes of the parallel strategy, see search_phase
     :return: a string of moves to complete phase 1
     """
     """
@@ -258,17 +679,24 @@ def phase1(faces):
     max_depth = 7 # Inclusive
 
     # Check if cube already done phase 1
-    if is_phase1_complete(faces):
+    if is_phase1_coord_complete(phase1_coordinate(faces)):
         return "No Phase 1 moves"
 
-    # Create a list of the banned moves for phase 1
-    banned = np.array(['U2', 'D2'])
-    return depth_search(banned, max_depth, is_phase1_complete, faces)
+    # Banned moves for phase 1 are in phase1_search
+    return search_phase(strategy, phase1_search, max_depth, faces, stats, observer, stop_time, transposition,
+                        workers)
 
 
-def phase2(faces):
+def phase2(faces, strategy='ida', stats=None, observer=None, stop_time=None, transposition=None,
+           workers=None):
     """
     Objective is to get all L and R corners on their faces, and orient FU, FD, BU, BD edges
+    :param strategy: key of search_strategies
+    :param stats: optional dict given to the search
+    :param observer: optional function given the events of the search, see instrumentation
+    :param stop_time: optional time.monotonic() value the search gives up after, it then returns None
+    :param transposition: optional TranspositionTable, see search_phase
+    :param workers: number of worker processes of the parallel strategy, see search_phase
     :return: a string of moves that satisfy phase 2
     """
 
@@ -276,51 +704,297 @@ def phase2(faces):
         return "No Phase 2 moves"
 
     max_depth = 10
-    # Banned moves for phase 2
-    banned = np.array(['U1', 'U3', 'D1', 'D3'])
-    return depth_search(banned, max_depth, is_phase2_complete, faces)
-
-
-
-
-
-
-
+    # Banned moves for phase 2 are in phase2_search
+    return search_phase(strategy, phase2_search, max_depth, faces, stats, observer, stop_time, transposition,
+                        workers)
 
 
+def phase3(faces, strategy='ida', stats=None, observer=None, stop_time=None, transposition=None,
+           workers=None):
+    """
+    Objective is to put every edge in its slice and the corners in a permutation half turns can solve.
+    Only L and R can still make quarter turns
+    :param strategy: key of search_strategies
+    :param stats: optional dict given to the search
+    :param observer: optional function given the events of the search, see instrumentation
+    :param stop_time: optional time.monotonic() value the search gives up after, it then returns None
+    :param transposition: optional TranspositionTable, see search_phase
+    :param workers: number of worker processes of the parallel strategy, see search_phase
+    :return: a string of moves that satisfy phase 3
+    """
 
+    coordinates = faces_to_coordinates(faces)
+    if is_phase3_coord_complete(coordinates['corner_permutation'], coordinates['e_slice']):
+        return "No Phase 3 moves"
 
+    max_depth = 13
+    return search_phase(strategy, phase3_search, max_depth, faces, stats, observer, stop_time, transposition,
+                        workers)
 
 
+def phase4(faces, strategy='ida', stats=None, observer=None, stop_time=None, transposition=None,
+           workers=None):
+    """
+    Objective is to solve the cube using only half turns
+    :param strategy: key of search_strategies
+    :param stats: optional dict given to the search
+    :param observer: optional function given the events of the search, see instrumentation
+    :param stop_time: optional time.monotonic() value the search gives up after, it then returns None
+    :param transposition: optional TranspositionTable, see search_phase
+    :param workers: number of worker processes of the parallel strategy, see search_phase
+    :return: a string of moves that satisfy phase 4
+    """
 
+    if phase4_coordinate(faces) == phase4_search.goal_coords[0]:
+        return "No Phase 4 moves"
 
+    max_depth = 15
+    return search_phase(strategy, phase4_search, max_depth, faces, stats, observer, stop_time, transposition,
+                        workers)
 
 
-def solve(faces):
+def phase_solutions(phase, max_depth, faces, stop_time=None):
     """
-    Output the moves that solves the given cube
-    :param CUBE: the class instance of the current rubiks cube
-    :return: nothing, the phases will output their moves
+    Every canonical move list of at most max_depth moves that completes the phase, shortest first.
+    The anytime solve tries the phases after phase 1 from more than one of them
+    :param phase: the SearchPhase to complete
+    :param max_depth: the max number of moves to solve the stage
+    :param faces: the original state of the cube given in a 2d list
+    :param stop_time: optional time.monotonic() value, no more solutions are looked for after it
+    :return: generator of lists of strings
     """
-    solved1 = phase1(faces)
-
-
-    # Put the moves on the faces that solved previous stage
-    # Ensure there was moves that solved it
-    if type(solved1) == list:
-        print(move_list_to_string(solved1))
-        move(solved1, faces)
-    else:
-        print(solved1)
+    distance = phase.distance()
+    start = phase.coordinate(faces)
+    successors = phase_successors(phase)
+    path = []
+
+    def search(coord, depth_left, last):
+        if depth_left == 0:
+            if distance[coord] == 0:
+                yield [all_moves[i] for i in path]
+            return
+        if stop_time is not None and time.monotonic() > stop_time:
+            return
+        for i in successors[last]:
+            next_coord = phase.move(coord, i)
+            if distance[next_coord] < depth_left:
+                path.append(i)
+                yield from search(next_coord, depth_left - 1, i)
+                path.pop()
+
+    for bound in range(max(distance[start], 0), max_depth + 1):
+        yield from search(start, bound, None)
+
+
+def solve_phases(cube, strategy='ida', observer=None, stop_time=None, phases=(phase1, phase2, phase3, phase4),
+                 transposition=None, workers=None):
+    """
+    Run the phases one after the other, the moves of each are put on the cube
+    :param cube: the np chararray of the cube, it is changed
+    :param strategy: key of search_strategies, how every phase is searched
+    :param observer: optional function given the 'depth' and 'phase' events
+    :param stop_time: optional time.monotonic() value the searches give up after
+    :param phases: the phase functions to run
+    :param transposition: optional TranspositionTable every phase search uses, see search_phase
+    :param workers: number of worker processes of the parallel strategy, see search_phase
+    :return: tuple (list of string moves or None when stop_time passed, search nodes, dict of phase name -> seconds)
+    """
+    solution = []
+    phase_seconds = {}
+    nodes = 0
+    for phase in phases:
+        phase_start = time.perf_counter()
+        phase_stats = {}
+        solved = phase(cube, strategy, phase_stats, observer, stop_time, transposition, workers)
+        phase_seconds[phase.__name__] = time.perf_counter() - phase_start
+        nodes += phase_stats.get('nodes', 0)
+        emit(observer, {'event': 'phase', 'phase': phase.__name__, 'seconds': phase_seconds[phase.__name__],
+                        'moves': len(solved) if type(solved) == list else 0, 'nodes': phase_stats.get('nodes', 0)})
+
+        # Put the moves on the faces that solved previous stage
+        # Ensure there was moves that solved it
+        if type(solved) == list:
+            move(solved, cube)
+            solution += solved
+        elif solved is None:
+            if stop_time is not None and time.monotonic() > stop_time:
+                return None, nodes, phase_seconds
+            raise ValueError("No solution found for " + phase.__name__)
+    return solution, nodes, phase_seconds
+
+
+def symmetric_cubes(faces):
+    """
+    The cube turned and mirrored by every symmetry, each needs its own phase solutions, so some are shorter
+    :param faces: the np chararray of cube
+    :return: generator of tuples (symmetry index, np chararray of the cube moved by it)
+    """
+    state = faces_to_state(faces)[None]
+    for s in range(len(face_permutations)):
+        yield s, state_to_faces(apply_symmetry(state, s)[0])
 
 
-    solved2 = phase2(faces)
+def improve(faces, best, stop_time, strategy='ida', observer=None, transposition=None, workers=None):
+    """
+    Keep solving the cube other ways until stop_time, first once for every symmetry of it, then from the
+    later solutions of phase 1 of each symmetry in turn
+    :param faces: the np chararray of cube
+    :param best: list of string moves solving it, to beat
+    :param stop_time: time.monotonic() value to stop at
+    :param strategy: key of search_strategies, how every phase is searched
+    :param observer: optional function given an 'improved' event for every shorter solution
+    :param transposition: optional TranspositionTable every phase search uses, see search_phase
+    :param workers: number of worker processes of the parallel strategy, see search_phase
+    :return: tuple (shortest list of string moves found, number of solutions tried)
+    """
+    start_time = time.monotonic()
+    tried = 0
+    rounds = [[(s, cube, None) for s, cube in symmetric_cubes(faces)][1:]]
+    rounds.append([(s, cube, phase_solutions(phase1_search, 7, cube, stop_time)) for s, cube in symmetric_cubes(faces)])
+    for candidates in rounds:
+        while candidates:
+            s, sym_faces, first_phases = candidates.pop(0)
+            cube = sym_faces.copy()
+            if first_phases is None:
+                solution, nodes, phase_seconds = solve_phases(cube, strategy, stop_time=stop_time,
+                                                              transposition=transposition, workers=workers)
+            else:
+                first = next(first_phases, None)
+                if first is None:
+                    continue
+                # Come back to this symmetry for its next phase 1 solution
+                candidates.append((s, sym_faces, first_phases))
+                move(first, cube)
+                solution, nodes, phase_seconds = solve_phases(cube, strategy, stop_time=stop_time,
+                                                              phases=(phase2, phase3, phase4),
+                                                              transposition=transposition, workers=workers)
+                if solution is not None:
+                    solution = first + solution
+            if time.monotonic() > stop_time:
+                return best, tried
+            tried += 1
+
+            # Moves that solve the symmetric cube solve the cube once conjugated back
+            solution = optimize_moves(conjugate_move_list(solution, int(inverse_symmetry[s])))
+            if len(solution) < len(best):
+                best = solution
+                emit(observer, {'event': 'improved', 'length': len(best), 'symmetry': s, 'tried': tried,
+                                'seconds': time.monotonic() - start_time})
+    return best, tried
+
+
+def thistlethwaite_solve(faces, strategy='ida', observer=None, stop_time=None, transposition=None,
+                         workers=None):
+    """
+    The four phases one after the other, then other ways until stop_time when there is one
+    :param faces: the np chararray of the cube, it is left unchanged
+    :param strategy: key of search_strategies, how every phase is searched
+    :param observer: optional function given the events of the solve
+    :param stop_time: optional time.monotonic() value to look for shorter solutions until
+    :param transposition: optional TranspositionTable every phase search uses, see search_phase
+    :param workers: number of worker processes of the parallel strategy, see search_phase
+    :return: tuple (list of string moves, dict of stats of the solve)
+    """
+    solve_start = time.perf_counter()
+    cube = faces.copy()
+    solution, nodes, phase_seconds = solve_phases(cube, strategy, observer, transposition=transposition,
+                                                  workers=workers)
+
+    # Moves can merge across the phase boundaries
+    optimized = optimize_moves(solution)
+    if not (move(optimized, faces.copy()) == cube).all():
+        raise RuntimeError("Optimizing changed the solution " + move_list_to_string(solution))
+    emit(observer, {'event': 'improved', 'length': len(optimized), 'symmetry': 0, 'tried': 0,
+                    'seconds': time.perf_counter() - solve_start})
+
+    solve_stats = {'raw_length': len(solution), 'nodes': nodes, 'phase_seconds': phase_seconds}
+    if stop_time is not None:
+        best, solve_stats['tried'] = improve(faces, optimized, stop_time, strategy, observer, transposition,
+                                             workers)
+        if best is not optimized:
+            if not (move(best, faces.copy()) == cube).all():
+                raise RuntimeError("Conjugating changed the solution " + move_list_to_string(best))
+            optimized = best
+    return optimized, solve_stats
+
+
+def kociemba_solve(faces, strategy='ida', observer=None, stop_time=None, transposition=None, workers=None):
+    """
+    The two phase algorithm, see kociemba.two_phase. It has its own search, strategy, transposition and workers
+    are not used
+    :return: tuple (list of string moves, dict of stats of the solve)
+    """
+    # kociemba imports this module, so it is only imported once it is used
+    import kociemba
+    solve_stats = {}
+    solution = kociemba.two_phase(faces, stop_time, observer=observer, stats=solve_stats)
+    state = faces_to_state(move(solution, faces.copy())).reshape(6, 9)
+    if not (state == state[:, 4:5]).all():
+        raise RuntimeError("The two phase solution does not solve the cube " + move_list_to_string(solution))
+    return solution, solve_stats
 
 
-    if type(solved2) == list:
-        print(move_list_to_string(solved2))
-        move(solved2, faces)
-    else:
-        print(solved2)
+# Ways to solve a whole cube
+solve_engines = {'thistlethwaite': thistlethwaite_solve, 'kociemba': kociemba_solve}
 
 
+def solve(faces, stats=None, cache=None, strategy='ida', observer=None, profile=None, deadline=None,
+          engine='thistlethwaite', transposition=None, workers=None):
+    """
+    Find the moves that solve the given cube
+    :param faces: the np chararray of the cube, it is left unchanged
+    :param stats: optional dict, gets the 'raw_length' of the solution before optimizing and the 'optimized_length',
+                  the search 'nodes' and, for the thistlethwaite engine, the 'phase_seconds' of each phase
+    :param cache: optional SolutionCache, looked up before searching and given every new solution
+    :param strategy: key of search_strategies, how every phase is searched
+    :param observer: optional function given every 'depth', 'phase', 'improved' and 'solve' event, see
+                     instrumentation
+    :param profile: optional dict, the solve is profiled and the report put in it, see instrumentation.profiling
+    :param deadline: optional seconds the solve may take. The first solution is always found (it takes
+                     milliseconds), then the cube is solved other ways, keeping the shortest, until the time is up
+    :param engine: key of solve_engines, 'thistlethwaite' runs the four phases of this module, 'kociemba' the
+                   two phase algorithm, which gives shorter solutions
+    :param transposition: optional TranspositionTable the ida searches of the phases share, its counters then
+                          go to stats as 'transposition' to size it. Only the ida strategy takes one
+    :param workers: number of worker processes the parallel strategy searches on, one per cpu when None. The
+                    pool of each number is started by the first solve that asks for it and kept
+    :return: a list of string moves
+    """
+    if engine not in solve_engines:
+        raise ValueError("engine must be one of " + ", ".join(solve_engines))
+    if transposition is not None and strategy != 'ida':
+        raise ValueError("Only the ida strategy uses a transposition table")
+    if workers is not None and strategy != 'parallel':
+        raise ValueError("Only the parallel strategy has worker processes")
+    if profile is not None:
+        with profiling(profile):
+            return solve(faces, stats, cache, strategy, observer, deadline=deadline, engine=engine,
+                         transposition=transposition, workers=workers)
+    stop_time = None if deadline is None else time.monotonic() + deadline
+
+    if not is_solvable(faces):
+        raise ValueError("The cube can not be solved, check the colors read")
+
+    if cache is not None:
+        cached = cache.get(faces, engine)
+        if stats is not None:
+            stats['cache_hit'] = cached is not None
+        if cached is not None:
+            return cached
+
+    solve_start = time.perf_counter()
+    optimized, solve_stats = solve_engines[engine](faces, strategy, observer, stop_time, transposition, workers)
+    emit(observer, {'event': 'solve', 'engine': engine, 'seconds': time.perf_counter() - solve_start,
+                    'raw_length': solve_stats['raw_length'], 'optimized_length': len(optimized),
+                    'nodes': solve_stats['nodes']})
+    if stats is not None:
+        nodes = stats.get('nodes', 0) + solve_stats.pop('nodes')
+        stats.update(solve_stats)
+        stats['nodes'] = nodes
+        stats['optimized_length'] = len(optimized)
+        if transposition is not None:
+            stats['transposition'] = transposition.stats()
+    if cache is not None:
+        cache.put(faces, optimized, engine)
+
+    return optimized
@@ -0,0 +1,299 @@
+import itertools
+import numpy as np
+from rubiks_cube import *
+from coordinates import edge_facelets, corner_facelets, corner_orientations, corner_orientation_coord, \
+    slice_positions, slice_rank
+
+# Symmetries of the cube
+# Turning the whole cube, or looking at it in a mirror, maps faces to faces. A symmetry is written as
+# where each face goes, and it moves every sticker and relabels every color the same way. Two states
+# one symmetry apart need the same number of moves, so tables and caches only need one state per class.
+
+#          0  1  2  3  4  5
+# faces = [B, U, F, D, R, L]
+axes = (('R', 'L'), ('U', 'D'), ('F', 'B'))
+
+
+def build_sticker_places():
+    """
+    Every sticker is told apart by its own face and the other faces of its cubie
+    :return: dict of (face index, frozenset of the other face indexes) -> flat sticker index
+    """
+    places = {}
+    for face in range(6):
+        places[(face, frozenset())] = face * 9 + 4
+    for facelets in list(edge_facelets) + list(corner_facelets):
+        cubie_faces = [int(f) // 9 for f in facelets]
+        for sticker, face in zip(facelets, cubie_faces):
+            places[(face, frozenset(cubie_faces) - {face})] = int(sticker)
+    return places
+
+
+sticker_places = build_sticker_places()
+
+
+def build_face_permutations():
+    """
+    All 48 ways to send faces to faces that keep opposite faces opposite
+    :return: list of tuples, entry f is the face index face f is sent to
+    """
+    face_permutations = []
+    for axis_order in itertools.permutations(range(3)):
+        for flips in itertools.product((False, True), repeat=3):
+            sent_to = {}
+            for axis, new_axis, flip in zip(axes, [axes[i] for i in axis_order], flips):
+                first, second = (new_axis[1], new_axis[0]) if flip else new_axis
+                sent_to[moves_dict[axis[0]]] = moves_dict[first]
+                sent_to[moves_dict[axis[1]]] = moves_dict[second]
+            face_permutations.append(tuple(sent_to[face] for face in range(6)))
+    # Identity first
+    face_permutations.sort(key=lambda permutation: permutation != tuple(range(6)))
+    return face_permutations
+
+
+face_permutations = build_face_permutations()
+
+
+def build_sticker_permutations():
+    """
+    :return: np int array of size 48, 54. Row s is the gather that moves the stickers of a state by
+             symmetry s: moved_state = state[row]
+    """
+    permutations = np.empty((len(face_permutations), 54), dtype=np.intp)
+    for s, sent_to in enumerate(face_permutations):
+        for (face, others), sticker in sticker_places.items():
+            new_sticker = sticker_places[(sent_to[face], frozenset(sent_to[f] for f in others))]
+            permutations[s, new_sticker] = sticker
+    return permutations
+
+
+sticker_permutations = build_sticker_permutations()
+
+
+def apply_symmetry(states, s):
+    """
+    Move and relabel the stickers of states by a symmetry. All states need the same center colors,
+    which is always the case for states a search reaches from one cube
+    :param states: np uint8 array of size N, 54
+    :param s: index of the symmetry
+    :return: np uint8 array of size N, 54
+    """
+    states = np.asarray(states)
+    relabel = np.arange(256, dtype=np.uint8)
+    centers = states[0, 4::9]
+    relabel[centers] = centers[list(face_permutations[s])]
+    return relabel[states[:, sticker_permutations[s]]]
+
+
+def build_conjugate_moves():
+    """
+    Find the move each move turns into under each symmetry, a mirror also turns clockwise into anti clockwise
+    :return: np int array of size 48, 18 of indexes into all_moves
+    """
+    solved = np.repeat(np.arange(6, dtype=np.uint8), 9)[None]
+    moved = move_batch(np.repeat(solved, len(all_moves), axis=0), np.arange(len(all_moves)))
+    move_of_state = {state.tobytes(): i for i, state in enumerate(moved)}
+
+    conjugates = np.empty((len(face_permutations), len(all_moves)), dtype=np.intp)
+    for s in range(len(face_permutations)):
+        for i, state in enumerate(apply_symmetry(moved, s)):
+            conjugates[s, i] = move_of_state[state.tobytes()]
+    return conjugates
+
+
+conjugate_moves = build_conjugate_moves()
+
+# The mirror images are the symmetries that swap clockwise and anti clockwise
+is_reflection = np.array([all_moves[conjugate_moves[s, 0]][1] == '3' for s in range(len(face_permutations))])
+rotations = [s for s in range(len(face_permutations)) if not is_reflection[s]]
+
+inverse_symmetry = np.array([face_permutations.index(tuple(np.argsort(sent_to))) for sent_to in face_permutations])
+
+
+def axis_symmetries(face):
+    """
+    :param face: char of a face on the axis to keep, 'U' gives the 16 symmetries keeping the U-D axis
+    :return: list of symmetry indexes
+    """
+    axis = {moves_dict[face], moves_dict[opposite_faces[face]]}
+    return [s for s, sent_to in enumerate(face_permutations) if {sent_to[f] for f in axis} == axis]
+
+
+def phase_symmetries(banned):
+    """
+    The symmetries that keep the moves of a phase the moves of the phase, only these can reduce its tables
+    :param banned: list of the moves not allowed in the phase
+    :return: list of symmetry indexes
+    """
+    allowed = {move_index[m] for m in all_moves if m not in banned}
+    return [s for s in range(len(face_permutations)) if {int(conjugate_moves[s, i]) for i in allowed} == allowed]
+
+
+def conjugate_move_list(move_list, s):
+    """
+    :param move_list: a list of string moves
+    :param s: index of the symmetry
+    :return: the list of moves doing the same thing on the cube moved by symmetry s
+    """
+    return [all_moves[conjugate_moves[s, move_index[each_move]]] for each_move in move_list]
+
+
+def representative(states, symmetries=None):
+    """
+    The smallest state, compared as bytes, of the symmetry class of each state
+    :param states: np uint8 array of size N, 54, all with the same center colors
+    :param symmetries: list of symmetry indexes to reduce by, all 48 when None
+    :return: tuple (np uint8 array of size N, 54 of the representatives,
+                    np int array of length N of the symmetry that gives each one)
+    """
+    states = np.asarray(states)
+    if symmetries is None:
+        symmetries = range(len(face_permutations))
+    symmetries = np.array(list(symmetries), dtype=np.intp)
+
+    moved = np.stack([apply_symmetry(states, s) for s in symmetries], axis=1)
+    keys = np.ascontiguousarray(moved).view('S54')[..., 0]
+    best = keys.argmin(axis=1)
+    return moved[np.arange(len(states)), best], symmetries[best]
+
+
+def build_cubie_symmetries():
+    """
+    Follow the stickers of each corner and edge position through every symmetry
+    :return: tuple of np int arrays (size 48, 8 of the position each corner position goes to,
+             size 48, 8, 3 of the sticker index k of a corner position becomes on its new position,
+             size 48, 12 of the position each edge position goes to)
+    """
+    corner_of_sticker = {int(f): (i, k) for i, facelets in enumerate(corner_facelets) for k, f in enumerate(facelets)}
+    edge_of_sticker = {int(f): i for i, facelets in enumerate(edge_facelets) for f in facelets}
+    corner_positions = np.empty((len(face_permutations), 8), dtype=np.intp)
+    corner_stickers = np.empty((len(face_permutations), 8, 3), dtype=np.intp)
+    edge_positions = np.empty((len(face_permutations), 12), dtype=np.intp)
+    for s in range(len(face_permutations)):
+        # moved_state[new] = state[permutation[new]], so the sticker at permutation[new] goes to new
+        goes_to = np.argsort(sticker_permutations[s])
+        for i, facelets in enumerate(corner_facelets):
+            for k, f in enumerate(facelets):
+                corner_positions[s, i], corner_stickers[s, i, k] = corner_of_sticker[int(goes_to[f])]
+        for i, facelets in enumerate(edge_facelets):
+            edge_positions[s, i] = edge_of_sticker[int(goes_to[facelets[0]])]
+    return corner_positions, corner_stickers, edge_positions
+
+
+corner_symmetry_positions, corner_symmetry_stickers, edge_symmetry_positions = build_cubie_symmetries()
+
+
+def corner_orientation_conjugates(symmetries):
+    """
+    Corner orientation is read from the R or L sticker, so the symmetries must keep the R-L axis
+    :param symmetries: list of symmetry indexes
+    :return: np int array of size len(symmetries), 2187 of each corner orientation coordinate moved by each symmetry
+    """
+    ori = corner_orientations(np.arange(2187))
+    conjugates = np.empty((len(symmetries), 2187), dtype=np.intp)
+    for row, s in enumerate(symmetries):
+        moved = np.empty_like(ori)
+        for i in range(8):
+            moved[:, corner_symmetry_positions[s, i]] = corner_symmetry_stickers[s, i][ori[:, i]]
+        conjugates[row] = corner_orientation_coord(moved)
+    return conjugates
+
+
+def slice_conjugates(symmetries):
+    """
+    :param symmetries: list of symmetry indexes that keep the slice, it is then only which positions its edges are in
+    :return: np int array of size len(symmetries), 495 of each slice coordinate moved by each symmetry
+    """
+    return np.array([slice_rank[(1 << edge_symmetry_positions[s][slice_positions]).sum(axis=1)] for s in symmetries],
+                    dtype=np.intp)
+
+
+class SymmetryReduction:
+    """
+    A coordinate outer * inner_size + inner stored with only the smallest outer coordinate of each symmetry class.
+    The symmetry that takes outer to its class representative moves inner too, so the distance table of the
+    phase is about len(symmetries) times smaller
+    """
+
+    def __init__(self, outer_conjugates, inner_conjugates):
+        """
+        :param outer_conjugates: np int array of size number of symmetries, outer size, of the outer coordinate
+                                 moved by each symmetry, see corner_orientation_conjugates
+        :param inner_conjugates: np int array of size number of symmetries, inner size, row for row the same symmetries
+        """
+        self.inner_size = inner_conjugates.shape[1]
+        self.outer_conjugates = outer_conjugates
+        self.inner_conjugates = inner_conjugates
+        # The representative of a class is its smallest outer coordinate
+        self.outer_representative = outer_conjugates.min(axis=0)
+        self.representatives, self.outer_class = np.unique(self.outer_representative, return_inverse=True)
+        self.size = len(self.representatives) * self.inner_size
+        # The same as lists, for reduce_one: the class of each outer, the rows of the symmetries that take it to
+        # its representative and the inner conjugates
+        self.outer_class_list = self.outer_class.tolist()
+        self.fixing_rows = [[row for row, fixes in enumerate(column) if fixes]
+                            for column in (outer_conjugates == self.outer_representative).T.tolist()]
+        self.inner_lists = inner_conjugates.tolist()
+
+    def reduce(self, coords):
+        """
+        :param coords: np int array of coordinates
+        :return: np int array of the index of each coordinate's representative in the reduced table
+        """
+        outer, inner = np.divmod(np.asarray(coords), self.inner_size)
+        representative = self.outer_representative[outer]
+        # Several symmetries can give the representative, the smallest inner they give makes the index the
+        # same for every state of a class
+        reduced_inner = np.full(np.shape(inner), self.inner_size)
+        for outer_row, inner_row in zip(self.outer_conjugates, self.inner_conjugates):
+            reduced_inner = np.where(outer_row[outer] == representative,
+                                     np.minimum(reduced_inner, inner_row[inner]), reduced_inner)
+        return self.outer_class[outer] * self.inner_size + reduced_inner
+
+    def reduce_one(self, coord):
+        """
+        reduce for one coordinate, without numpy, the searches look one coordinate up per node
+        :param coord: int coordinate
+        :return: int index of its representative in the reduced table
+        """
+        outer, inner = divmod(int(coord), self.inner_size)
+        return self.outer_class_list[outer] * self.inner_size + \
+            min(self.inner_lists[row][inner] for row in self.fixing_rows[outer])
+
+    def coordinates(self, reduced):
+        """
+        :param reduced: np int array of indexes in the reduced table
+        :return: np int array of the coordinates of the representatives
+        """
+        outer, inner = np.divmod(np.asarray(reduced), self.inner_size)
+        return self.representatives[outer] * self.inner_size + inner
+
+    def move_func(self, move_func):
+        """
+        :param move_func: function (coordinates, move index) -> coordinates after the move
+        :return: the same function on indexes in the reduced table
+        """
+        return lambda reduced, i: self.reduce(move_func(self.coordinates(reduced), i))
+
+
+class ReducedTable:
+    """
+    A table with one entry per symmetry class, looked up by the coordinates of any state like the full table
+    """
+
+    def __init__(self, table, reduction):
+        """
+        :param table: np array of size reduction.size
+        :param reduction: the SymmetryReduction it is indexed by
+        """
+        self.table = table
+        self.reduction = reduction
+
+    def __getitem__(self, coords):
+        """
+        :param coords: int coordinate or np int array of coordinates
+        :return: the entry of each coordinate's class
+        """
+        if np.ndim(coords) == 0:
+            return self.table[self.reduction.reduce_one(coords)]
+        return self.table[self.reduction.reduce(coords)]
@@ -0,0 +1,38 @@
+import batch
+
+solved_cube = 'o' * 9 + 'y' * 9 + 'r' * 9 + 'w' * 9 + 'g' * 9 + 'b' * 9
+
+
+def test_solve_cube_string():
+    assert batch.solve_cube_string((3, solved_cube)) == {'index': 3, 'cube': solved_cube, 'solution': '',
+                                                           'length': 0}
+
+
+def test_invalid_cube_is_an_error_line():
+    result = batch.solve_cube_string((0, 'o' * 54))
+    assert result['index'] == 0 and 'error' in result
+
+
+def test_solver_failure_is_an_error_line(monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("engine failed")
+    monkeypatch.setattr(batch, 'solve', fail)
+    assert batch.solve_cube_string((1, solved_cube)) == {'index': 1, 'cube': solved_cube,
+                                                           'error': "RuntimeError: engine failed"}
+
+
+def test_transposition_counters_are_on_the_result_line(monkeypatch):
+    monkeypatch.setattr(batch, 'worker_transposition', None)
+    batch.load_tables(transposition_capacity=1000)
+    cube = 'rowrooogbgwoyyowworrbrrrrobywwbwyyggyywygbrgoybgbbgbwg'
+    result = batch.solve_cube_string((0, cube))
+    assert 'solution' in result and result['transposition']['capacity'] == 1000
+
+
+def test_bad_lines_get_an_error_line_in_their_place():
+    lines = [solved_cube, solved_cube[:53], solved_cube[:9], solved_cube[9:18], solved_cube, solved_cube[:9]]
+    cubes = list(batch.read_cube_strings(lines))
+    assert cubes == [solved_cube, solved_cube[:53], solved_cube[:18], solved_cube, solved_cube[:9]]
+    results = [batch.solve_cube_string(numbered) for numbered in enumerate(cubes)]
+    assert [result['index'] for result in results] == [0, 1, 2, 3, 4]
+    assert ['error' in result for result in results] == [False, True, True, False, True]
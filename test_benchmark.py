@@ -0,0 +1,29 @@
+import builtins
+import numpy as np
+import benchmark
+
+
+def test_compare_flags_only_regressions_past_the_threshold():
+    baseline = {'solve_p50_ms': 10.0, 'move_per_sec': 1000.0, 'solve_max_ms': 10.0}
+    results = {'solve_p50_ms': 13.0, 'move_per_sec': 700.0, 'solve_max_ms': 11.0}
+    regressions = benchmark.compare(results, baseline, 0.2)
+    assert [regression.split(':')[0] for regression in regressions] == ['solve_p50_ms', 'move_per_sec']
+
+
+def test_measure_memory_without_resource(monkeypatch):
+    real_import = builtins.__import__
+
+    def no_resource(name, *args, **kwargs):
+        if name == 'resource':
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    cubes = benchmark.benchmark_cubes(0, 1, 10)[:1]
+    assert 'peak_rss_mb' in benchmark.measure_memory(cubes, 'ida')
+    monkeypatch.setattr(builtins, '__import__', no_resource)
+    assert list(benchmark.measure_memory(cubes, 'ida')) == ['solve_peak_alloc_kb']
+
+
+def test_benchmark_cubes_are_seeded():
+    first, second = benchmark.benchmark_cubes(3, 2, 10), benchmark.benchmark_cubes(3, 2, 10)
+    assert all((a == b).all() for a, b in zip(first, second))
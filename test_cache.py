@@ -0,0 +1,44 @@
+import numpy as np
+from rubiks_cube import *
+from symmetry import apply_symmetry, face_permutations
+from cache import canonical_key, SolutionCache
+
+solved_cube = 'o' * 9 + 'y' * 9 + 'r' * 9 + 'w' * 9 + 'g' * 9 + 'b' * 9
+
+
+def scrambled_faces(seed, length=20):
+    rng = np.random.default_rng(seed)
+    return move([all_moves[i] for i in rng.integers(len(all_moves), size=length)], string_to_faces(solved_cube))
+
+
+def test_canonical_key_is_the_same_under_every_symmetry():
+    for seed in range(5):
+        faces = scrambled_faces(seed)
+        key = canonical_key(faces)[0]
+        for s in range(len(face_permutations)):
+            moved = state_to_faces(apply_symmetry(faces_to_state(faces)[None], s)[0])
+            assert canonical_key(moved)[0] == key
+
+
+def test_canonical_key_ignores_the_color_scheme():
+    faces = scrambled_faces(0)
+    recolored = string_to_faces(faces_to_string(faces).translate(str.maketrans('oyrwgb', 'gwobyr')))
+    assert canonical_key(recolored)[0] == canonical_key(faces)[0]
+
+
+def test_different_cubes_have_different_keys():
+    assert canonical_key(scrambled_faces(0))[0] != canonical_key(scrambled_faces(1))[0]
+
+
+def test_canonical_key_tells_the_engines_apart():
+    faces = scrambled_faces(0)
+    assert canonical_key(faces, 'kociemba')[0] != canonical_key(faces, 'thistlethwaite')[0]
+
+
+def test_cached_solutions_are_only_returned_for_their_engine(tmp_path):
+    cache = SolutionCache(str(tmp_path / 'solutions.sqlite'))
+    faces = move(['R1', 'U1'], string_to_faces(solved_cube))
+    cache.put(faces, ['U3', 'R3'], 'kociemba')
+    assert cache.get(faces, 'thistlethwaite') is None
+    assert cache.get(faces, 'kociemba') == ['U3', 'R3']
+    cache.close()
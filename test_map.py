@@ -0,0 +1,226 @@
+import threading
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+from map import build_color_lut, DropOldestQueue, FaceConsensus, MapRubiksCube
+
+
+def test_drop_oldest_queue_keeps_the_newest_items():
+    queue = DropOldestQueue(2)
+    for i in range(5):
+        queue.put(i)
+    assert queue.dropped == 3
+    assert queue.get(timeout=0) == 3
+    assert queue.get(timeout=0) == 4
+    assert queue.get(timeout=0.01) is None
+
+
+def test_drop_oldest_queue_get_waits_for_a_put():
+    queue = DropOldestQueue(1)
+    timer = threading.Timer(0.05, queue.put, args=('frame',))
+    timer.start()
+    assert queue.get(timeout=5) == 'frame'
+    timer.join()
+    assert queue.dropped == 0
+
+
+def test_color_lut_keeps_every_color_a_pixel_is_in():
+    lut, names = build_color_lut({'first': ((0, 0, 0), (20, 255, 255)), 'second': ((10, 0, 0), (30, 255, 255))},
+                                 {'second': ((100, 0, 0), (110, 255, 255))})
+    assert names == ('first', 'second')
+    assert [lut[(h << 16) | (100 << 8) | 100] for h in (5, 15, 25, 40, 105)] == [1, 3, 2, 0, 2]
+
+
+# HSV of a sticker of each color, orange_yellow is in the ranges of both
+sticker_hsv = {'y': (30, 200, 220), 'o': (12, 200, 220), 'g': (75, 200, 200), 'b': (110, 200, 200),
+               'r': (170, 200, 200), 'w': (0, 5, 240), 'orange_yellow': (20, 200, 220)}
+face = [['y', 'o', 'g'], ['b', 'r', 'w'], ['o', 'g', 'y']]
+
+
+def draw_face(hsv, rows, left, top):
+    """
+    Draw the 3 by 3 stickers of rows with their top left corner at left, top, the orange stickers half in the
+    overlap with yellow
+    """
+    for row in range(3):
+        for col in range(3):
+            x, y = left + col * 60, top + row * 60
+            hsv[y:y + 50, x:x + 50] = sticker_hsv[rows[row][col]]
+            if rows[row][col] == 'o':
+                hsv[y:y + 50, x + 25:x + 50] = sticker_hsv['orange_yellow']
+
+
+def face_frame():
+    """
+    :return: BGR frame of the face in the middle of the window
+    """
+    hsv = np.zeros((480, 640, 3), dtype=np.uint8)
+    draw_face(hsv, face, 240, 150)
+    return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+
+
+def test_stickers_in_overlapping_ranges_are_read_whole():
+    expected = [face[2 - i // 3][2 - i % 3] for i in range(9)]
+    scanner = MapRubiksCube()
+    squares, side, colors = scanner.process_frame(face_frame(), use_grid=False, known_centre=False)
+    assert scanner.order_squares(squares, None) == expected
+    assert scanner.sample_grid(face_frame(), known_centre=False)[0] == expected
+
+
+def test_classify_pixels_looks_up_every_channel():
+    scanner = MapRubiksCube()
+    hsv = np.random.default_rng(0).integers(256, size=(48, 64, 3), dtype=np.uint8)
+    hsv[..., 0] %= 180
+    expected = scanner.color_lut.reshape(180, 256, 256)[hsv[..., 0], hsv[..., 1], hsv[..., 2]]
+    assert (scanner.classify_pixels(hsv) == expected).all()
+
+
+side = ['b', 'g', 'y', 'w', 'o', 'r', 'b', 'g', 'y']
+misread = ['r'] + side[1:]
+
+
+def test_face_consensus_confirms_a_face_once_stable():
+    consensus = FaceConsensus(window=10, stable_frames=5, min_confidence=0.8)
+    results = [consensus.update(each) for each in [side, misread] + [side] * 5]
+    assert results[:-1] == [None] * 6
+    colors, confidence = results[-1]
+    assert colors == side
+    assert confidence == [6 / 7] + [1.0] * 8
+    assert 'o' in consensus.confirmed
+    assert len(consensus.history) == 0
+
+
+def test_face_consensus_does_not_confirm_a_face_twice():
+    consensus = FaceConsensus(window=10, stable_frames=3)
+    assert [consensus.update(side) for _ in range(3)][-1] is not None
+    assert [consensus.update(side) for _ in range(10)] == [None] * 10
+
+
+def test_face_consensus_waits_for_min_confidence():
+    consensus = FaceConsensus(window=10, stable_frames=3, min_confidence=0.9)
+    results = [consensus.update(each) for each in [misread, misread] + [side] * 9]
+    # The second misread only leaves the window on the last frame, 9 of 10 votes
+    assert results[:-1] == [None] * 10
+    assert results[-1][1][0] == 0.9
+
+
+def test_face_consensus_resets_on_another_face():
+    consensus = FaceConsensus(window=10, stable_frames=3)
+    other = side[:4] + ['y'] + side[5:]
+    assert [consensus.update(each) for each in [side, side, other, side, side]] == [None] * 5
+    assert consensus.stable_count() == 2
+    assert consensus.update(side) is not None
+
+
+def test_face_consensus_only_takes_the_expected_centre():
+    consensus = FaceConsensus(window=10, stable_frames=3)
+    assert [consensus.update(side, expected='y') for _ in range(5)] == [None] * 5
+    assert consensus.update(['?'] * 9) is None
+    assert len(consensus.history) == 0
+
+
+def test_face_consensus_drops_votes_after_missed_frames():
+    consensus = FaceConsensus(window=10, stable_frames=3, max_missed=2)
+    consensus.update(side)
+    consensus.update(side)
+    for _ in range(3):
+        consensus.update(None)
+    assert len(consensus.history) == 0
+    assert consensus.update(side) is None
+
+
+def test_fit_grid_follows_a_face_seen_at_an_angle():
+    corners = np.array([(40, 20), (130, 30), (150, 140), (20, 120)], dtype=np.float32)
+    masks = np.zeros((165, 165), dtype=np.uint8)
+    cv2.fillConvexPoly(masks, corners.astype(np.int32), 1)
+    centres = MapRubiksCube().fit_grid(masks)
+
+    grid = np.array([(0, 0), (3, 0), (3, 3), (0, 3)], dtype=np.float32)
+    expected = cv2.perspectiveTransform(np.array([[(col + 0.5, row + 0.5)] for row in range(3) for col in range(3)],
+                                                 dtype=np.float32), cv2.getPerspectiveTransform(grid, corners))
+    assert np.abs(centres.reshape(9, 2) - expected.reshape(9, 2)).max() < 2
+
+
+def test_process_frame_keeps_the_squares_of_each_frame_apart():
+    scanner = MapRubiksCube()
+    frame = face_frame()
+    found = []
+
+    def process():
+        for _ in range(10):
+            found.append(len(scanner.process_frame(frame, use_grid=False)[0]))
+
+    threads = [threading.Thread(target=process) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert found == [9] * 40
+    assert scanner.pending_squares == []
+
+
+def test_scanners_keep_their_own_sides():
+    first, second = MapRubiksCube(), MapRubiksCube()
+    first.cube.append(['o'] * 9)
+    first.face_confidence.append([1.0] * 9)
+    assert second.cube == [] and second.face_confidence == []
+    assert MapRubiksCube().cube == []
+
+
+def side_rows(centre):
+    """
+    :return: 3 by 3 colors of a side with the given centre, every color on it
+    """
+    colors = MapRubiksCube.sides
+    return [[colors[(colors.index(centre) + 3 * row + col - 4) % 6] for col in range(3)] for row in range(3)]
+
+
+class StandInCapture:
+    """
+    Plays the frames of videos instead of a cv2.VideoCapture
+    """
+    videos = {}
+
+    def __init__(self, source):
+        self.frames = list(self.videos[source])
+
+    def read(self):
+        return (True, self.frames.pop(0)) if self.frames else (False, None)
+
+    def release(self):
+        pass
+
+
+def test_multi_camera_scanner_reads_every_window_of_every_camera(monkeypatch):
+    import map
+
+    def sides_frame(left_centre, right_centre):
+        hsv = np.zeros((480, 640, 3), dtype=np.uint8)
+        draw_face(hsv, side_rows(left_centre), 70, 150)
+        draw_face(hsv, side_rows(right_centre), 400, 150)
+        return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+
+    # Each camera sees two sides at once, the first camera is then shown two more
+    videos = {'first.avi': [sides_frame('o', 'y')] * 8 + [sides_frame('r', 'w')] * 8,
+              'second.avi': [sides_frame('g', 'b')] * 8}
+    monkeypatch.setattr(StandInCapture, 'videos', videos)
+    monkeypatch.setattr(map.cv2, 'VideoCapture', StandInCapture)
+    windows = [(0, 320, 60, 420), (320, 640, 60, 420)]
+    multi = map.MultiCameraScanner(['first.avi', 'second.avi'], rois=[windows, windows])
+    cube = multi.run(timeout=30)
+
+    expected = "".join("".join(side_rows(centre)[2 - i // 3][2 - i % 3] for i in range(9))
+                       for centre in MapRubiksCube.sides)
+    assert "".join(cube.flatten().astype(str)) == expected
+    assert multi.stats()['found_by'] == {'o': 'first.avi', 'y': 'first.avi', 'r': 'first.avi', 'w': 'first.avi',
+                                         'g': 'second.avi', 'b': 'second.avi'}
+    # Each window confirmed its own sides
+    assert [[side[4] for side in scanner.cube] for scanner in multi.scanners[0]] == [['o', 'r'], ['y', 'w']]
+    assert [[side[4] for side in scanner.cube] for scanner in multi.scanners[1]] == [['g'], ['b']]
+
+
+def test_multi_camera_scanner_needs_a_window_per_source():
+    from map import MultiCameraScanner
+    with pytest.raises(ValueError):
+        MultiCameraScanner(['first.avi', 'second.avi'], rois=[[(0, 320, 60, 420)]])
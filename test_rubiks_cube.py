@@ -0,0 +1,39 @@
+import numpy as np
+from rubiks_cube import *
+
+
+def random_sequence(rng, length):
+    """
+    :return: list of length random string moves
+    """
+    return [all_moves[i] for i in rng.integers(len(all_moves), size=length)]
+
+
+def solved_faces():
+    faces = np.chararray((6, 9), 1, True)
+    for i, color in enumerate('oyrwgb'):
+        faces[i] = color
+    return faces
+
+
+def test_move_matches_swap_move():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        sequence = random_sequence(rng, 20)
+        expected = np.arange(54).reshape(6, 9)
+        swap_move(sequence, expected)
+        assert (move(sequence, np.arange(54).reshape(6, 9)) == expected).all()
+
+
+def test_move_matches_swap_move_on_colors():
+    rng = np.random.default_rng(1)
+    for _ in range(10):
+        sequence = random_sequence(rng, 25)
+        expected = solved_faces()
+        swap_move(sequence, expected)
+        assert (move(sequence, solved_faces()) == expected).all()
+
+
+def test_four_quarter_turns_do_nothing():
+    for face in 'UDFBRL':
+        assert (move([face + '1'] * 4, np.arange(54).reshape(6, 9)) == np.arange(54).reshape(6, 9)).all()
@@ -0,0 +1,39 @@
+import asyncio
+import server
+
+solved_cube = server.solved_cube
+
+
+def fail_solve(numbered_cube):
+    raise RuntimeError("worker failed")
+
+
+def test_failed_solve_is_answered_and_forgotten(monkeypatch):
+    monkeypatch.setattr(server, 'solve_cube_string', fail_solve)
+    service = server.SolverService(workers=1)
+
+    async def requests():
+        return await asyncio.gather(service.handle_request(solved_cube), service.handle_request(solved_cube))
+
+    try:
+        replies = asyncio.run(requests())
+    finally:
+        service.close()
+    assert replies == [{'cube': solved_cube, 'error': "RuntimeError: worker failed"}] * 2
+    assert service.pending == {}
+    assert service.stats()['coalesced'] == 1
+    assert service.stats()['failed'] == 1
+
+
+def test_solve_and_stats():
+    service = server.SolverService(workers=1)
+
+    async def requests():
+        return await service.handle_request(solved_cube), await service.handle_request('stats')
+
+    try:
+        reply, stats = asyncio.run(requests())
+    finally:
+        service.close()
+    assert reply == {'cube': solved_cube, 'solution': '', 'length': 0}
+    assert stats['requests'] == 1 and stats['pending'] == 0 and stats['failed'] == 0
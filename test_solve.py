@@ -0,0 +1,138 @@
+import os
+import numpy as np
+import pytest
+from rubiks_cube import *
+import solve
+from benchmark import benchmark_cubes
+from solve import optimize_moves, SearchPhase, phase1_coordinate, phase1_move
+
+solved_cube = 'o' * 9 + 'y' * 9 + 'r' * 9 + 'w' * 9 + 'g' * 9 + 'b' * 9
+
+
+def random_sequences(seed, count, length, faces='UDFBRL'):
+    """
+    :param faces: the faces the moves turn, few faces give many moves to merge
+    :return: list of count lists of length random string moves
+    """
+    rng = np.random.default_rng(seed)
+    return [[rng.choice(list(faces)) + str(rng.integers(1, 4)) for _ in range(length)] for _ in range(count)]
+
+
+def test_optimize_moves_merges_across_opposite_faces():
+    assert optimize_moves(['R1', 'R2']) == ['R3']
+    assert optimize_moves(['U1', 'U3']) == []
+    assert optimize_moves(['R1', 'L1', 'R1']) == ['R2', 'L1']
+    assert optimize_moves(['L1', 'R1']) == ['R1', 'L1']
+    assert optimize_moves(['R1', 'U1', 'R1']) == ['R1', 'U1', 'R1']
+
+
+def test_optimize_moves_keeps_what_the_moves_do():
+    for faces in ('UDFBRL', 'RL', 'RLU'):
+        for sequence in random_sequences(0, 50, 30, faces):
+            optimized = optimize_moves(sequence)
+            assert len(optimized) <= len(sequence)
+            assert (move(optimized, np.arange(54).reshape(6, 9)) == move(sequence, np.arange(54).reshape(6, 9))).all()
+
+
+def test_optimize_moves_is_idempotent():
+    for faces in ('UDFBRL', 'RL', 'RLU'):
+        for sequence in random_sequences(1, 50, 30, faces):
+            optimized = optimize_moves(sequence)
+            assert optimize_moves(optimized) == optimized
+
+
+def edge_orientation_phase():
+    return SearchPhase('phase1', ['U2', 'D2'], 2048, phase1_coordinate, phase1_move, [0])
+
+
+def test_distance_tables_are_saved_whole(tmp_path, monkeypatch):
+    monkeypatch.setattr(solve, 'table_directory', str(tmp_path))
+    table = edge_orientation_phase().distance()
+    assert os.listdir(tmp_path) == ['phase1.npy']
+    assert (np.load(tmp_path / 'phase1.npy') == table).all()
+
+
+def test_distance_tables_half_written_or_outdated_are_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.setattr(solve, 'table_directory', str(tmp_path))
+    table = edge_orientation_phase().distance()
+    saved = (tmp_path / 'phase1.npy').read_bytes()
+    (tmp_path / 'phase1.npy').write_bytes(saved[:len(saved) // 2])
+    assert (edge_orientation_phase().distance() == table).all()
+    np.save(tmp_path / 'phase1.npy', table[:1000])
+    assert (edge_orientation_phase().distance() == table).all()
+    assert len(np.load(tmp_path / 'phase1.npy')) == 2048
+
+
+def test_coordinate_move_tables_agree_with_moving_the_stickers():
+    rng = np.random.default_rng(0)
+    for phase, coordinate in ((solve.phase1_search, solve.phase1_coordinate),
+                              (solve.phase2_search, solve.phase2_coordinate),
+                              (solve.phase3_search, solve.phase3_coordinate),
+                              (solve.phase4_search, solve.phase4_coordinate)):
+        for _ in range(10):
+            # Only the moves of the phase keep the cube where its coordinate is defined
+            scramble = [all_moves[i] for i in rng.choice(phase.move_indexes, size=20)]
+            faces = move(scramble, string_to_faces(solved_cube))
+            for i in phase.move_indexes:
+                assert coordinate(move([all_moves[i]], faces.copy())) == phase.move(coordinate(faces), i)
+
+
+def is_solved(faces):
+    state = faces_to_state(faces).reshape(6, 9)
+    return bool((state == state[:, 4:5]).all())
+
+
+def test_solve_solves_scrambled_and_uniformly_random_cubes():
+    assert solve.solve(string_to_faces(solved_cube)) == []
+    for faces in benchmark_cubes(0, 5, 25):
+        solution = solve.solve(faces)
+        assert is_solved(move(solution, faces.copy()))
+        assert len(solution) <= 52
+
+
+def test_every_strategy_finds_the_shortest_phases():
+    for faces in benchmark_cubes(1, 5, 25):
+        cube = faces.copy()
+        for phase in (solve.phase1, solve.phase2, solve.phase3, solve.phase4):
+            # Each phase from the same cube, the phases after it depend on which shortest solution was taken
+            solutions = {strategy: phase(cube.copy(), strategy) for strategy in solve.search_strategies}
+            lengths = {len(solution) if type(solution) == list else 0 for solution in solutions.values()}
+            assert len(lengths) == 1, (phase.__name__, solutions)
+            if type(solutions['ida']) == list:
+                move(solutions['ida'], cube)
+        assert is_solved(cube)
+
+
+def test_parallel_strategy_runs_on_the_workers_asked_for():
+    import parallel
+    faces = benchmark_cubes(2, 1, 25)[0]
+    solution = solve.solve(faces, strategy='parallel', workers=2)
+    assert is_solved(move(solution, faces.copy()))
+    assert parallel.searches[2].workers == 2 and parallel.searches[2].pool is not None
+    parallel.searches.pop(2).close()
+
+
+def test_workers_are_only_for_the_parallel_strategy():
+    with pytest.raises(ValueError):
+        solve.solve(benchmark_cubes(2, 1, 25)[0], workers=2)
+
+
+def test_kociemba_engine_solves_random_cubes_in_few_moves():
+    import kociemba
+    for faces in benchmark_cubes(3, 5, 25):
+        events, stats = [], {}
+        solution = solve.solve(faces, stats, engine='kociemba', observer=events.append)
+        assert is_solved(move(solution, faces.copy()))
+        assert len(solution) <= kociemba.target_length + kociemba.overtime_moves
+        improved = [event for event in events if event['event'] == 'improved']
+        assert improved[-1]['length'] == len(solution) <= stats['raw_length']
+
+
+def test_kociemba_engine_searches_until_the_deadline():
+    import time
+    faces = benchmark_cubes(4, 1, 25)[0]
+    solve.solve(faces, engine='kociemba')
+    start = time.monotonic()
+    solution = solve.solve(faces, engine='kociemba', deadline=0.3)
+    assert time.monotonic() - start >= 0.3
+    assert is_solved(move(solution, faces.copy()))
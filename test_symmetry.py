@@ -0,0 +1,46 @@
+import numpy as np
+from rubiks_cube import *
+from coordinates import *
+from symmetry import *
+from solve import phase2_search, phase2_symmetries, phase2_coordinate
+
+
+def scrambled_states(seed, count, length=25):
+    """
+    :return: np uint8 array of size count, 54 of scrambled states
+    """
+    rng = np.random.default_rng(seed)
+    states = np.repeat(np.repeat(np.frombuffer(b'oyrwgb', dtype=np.uint8), 9)[None], count, axis=0)
+    for _ in range(length):
+        states = move_batch(states, rng.integers(len(all_moves), size=count))
+    return states
+
+
+def test_coordinate_conjugates_match_the_stickers():
+    corner_conjugates = corner_orientation_conjugates(phase2_symmetries)
+    m_slice_conjugates = slice_conjugates(phase2_symmetries)
+    for state in scrambled_states(0, 30):
+        corner_perm, corner_ori, edge_perm, edge_ori = state_to_cubies(state)
+        for row, s in enumerate(phase2_symmetries):
+            moved_perm, moved_ori, moved_edges, _ = state_to_cubies(apply_symmetry(state[None], s)[0])
+            assert corner_orientation_coord(moved_ori) == corner_conjugates[row, corner_orientation_coord(corner_ori)]
+            assert slice_coord(moved_edges, m_slice) == m_slice_conjugates[row, slice_coord(edge_perm, m_slice)]
+
+
+def test_reduce_gives_one_index_per_class():
+    reduction = phase2_search.reduction
+    coords = np.array([phase2_coordinate(state_to_faces(state)) for state in scrambled_states(1, 20)])
+    for row, s in enumerate(phase2_symmetries):
+        moved = np.array([phase2_coordinate(state_to_faces(apply_symmetry(state[None], s)[0]))
+                          for state in scrambled_states(1, 20)])
+        assert (reduction.reduce(moved) == reduction.reduce(coords)).all()
+        assert [reduction.reduce_one(coord) for coord in moved] == reduction.reduce(coords).tolist()
+
+
+def test_reduced_phase2_table_matches_the_full_table():
+    full = build_distance_table(phase2_search.size, phase2_search.goal_coords, phase2_search.move,
+                                phase2_search.move_indexes)
+    assert phase2_search.reduction.size * 6 < phase2_search.size
+    assert (phase2_search.distance()[np.arange(phase2_search.size)] == full).all()
+    coords = np.random.default_rng(2).integers(phase2_search.size, size=1000)
+    assert [phase2_search.distance()[int(coord)] for coord in coords] == full[coords].tolist()
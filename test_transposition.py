@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from transposition import TranspositionTable, state_keys
+
+
+def test_lru_evicts_the_state_looked_up_longest_ago():
+    table = TranspositionTable(capacity=2)
+    assert not table.seen('a', 1)
+    assert not table.seen('b', 1)
+    # A hit makes 'a' the most recent, so 'b' goes first
+    assert table.seen('a', 1)
+    assert not table.seen('c', 1)
+    assert table.seen('a', 2)
+    assert not table.seen('b', 1)
+    assert len(table) == 2
+    assert table.stats() == {'size': 2, 'capacity': 2, 'hits': 2, 'misses': 4, 'evictions': 2,
+                             'hit_rate': 2 / 6}
+
+
+def test_fifo_evicts_the_state_stored_first():
+    table = TranspositionTable(capacity=2, eviction='fifo')
+    table.seen('a', 1)
+    table.seen('b', 1)
+    assert table.seen('a', 1)
+    table.seen('c', 1)
+    assert not table.seen('a', 1)
+    assert table.evictions == 2
+
+
+def test_only_a_state_reached_as_deep_or_deeper_is_skipped():
+    table = TranspositionTable()
+    assert not table.seen('a', 3)
+    assert table.seen('a', 4)
+    assert table.seen('a', 3)
+    assert not table.seen('a', 2)
+    assert table.seen('a', 2)
+    assert (table.hits, table.misses) == (3, 2)
+
+
+def test_filter_and_clear():
+    table = TranspositionTable()
+    states = np.array([[1] * 54, [2] * 54, [1] * 54], dtype=np.uint8)
+    keys = state_keys(states)
+    assert keys[0] == keys[2] != keys[1]
+    assert table.filter(keys, 1).tolist() == [True, True, False]
+    table.clear()
+    assert len(table) == 0
+    assert table.misses == 2
+
+
+def test_unknown_eviction():
+    with pytest.raises(ValueError):
+        TranspositionTable(eviction='random')
+
+
+def test_solve_shares_a_transposition_table_between_the_phases():
+    from benchmark import benchmark_cubes
+    from solve import solve
+    table = TranspositionTable(capacity=10000)
+    for faces in benchmark_cubes(2, 2, 25):
+        stats = {}
+        assert solve(faces, stats, transposition=table) == solve(faces)
+        assert stats['transposition'] == table.stats()
+    assert table.misses > 0
+
+
+def test_only_ida_takes_a_transposition_table():
+    from benchmark import benchmark_cubes
+    from solve import solve
+    with pytest.raises(ValueError):
+        solve(benchmark_cubes(2, 1, 25)[0], strategy='bidirectional', transposition=TranspositionTable())
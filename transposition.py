@@ -0,0 +1,85 @@
+from collections import OrderedDict
+import numpy as np
+
+# Transposition table
+# Different move lists often reach the same cube. A search remembers the depth it first reached each
+# state at, and skips a state again when it comes back to it at the same or a greater depth.
+
+
+def state_keys(states):
+    """
+    :param states: np uint8 array of size N, 54
+    :return: list of N bytes keys, one per state
+    """
+    states = np.ascontiguousarray(states)
+    return states.view('S' + str(states.shape[1])).ravel().tolist()
+
+
+class TranspositionTable:
+    """
+    Memory bounded map of state key -> lowest depth the state was reached at
+    """
+
+    evictions_allowed = ('lru', 'fifo')
+
+    def __init__(self, capacity=1000000, eviction='lru'):
+        """
+        :param capacity: the max number of states kept
+        :param eviction: 'lru' drops the state not looked up for longest, 'fifo' the one stored first
+        """
+        if eviction not in self.evictions_allowed:
+            raise ValueError("eviction must be one of " + ", ".join(self.evictions_allowed))
+        self.capacity = capacity
+        self.eviction = eviction
+        self.depths = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.depths)
+
+    def seen(self, key, depth):
+        """
+        Look a state up and remember it
+        :param key: hashable key of the state, bytes from state_keys or a coordinate
+        :param depth: the depth the search reached the state at
+        :return: True if the state was already reached at the same or a lower depth, it can be skipped
+        """
+        known_depth = self.depths.get(key)
+        if known_depth is not None and known_depth <= depth:
+            self.hits += 1
+            if self.eviction == 'lru':
+                self.depths.move_to_end(key)
+            return True
+
+        self.misses += 1
+        self.depths[key] = depth
+        if self.eviction == 'lru':
+            self.depths.move_to_end(key)
+        if len(self.depths) > self.capacity:
+            self.depths.popitem(last=False)
+            self.evictions += 1
+        return False
+
+    def filter(self, keys, depth):
+        """
+        :param keys: list of state keys all reached at depth
+        :param depth: the depth of the states
+        :return: np bool array, True for the states that still need searching
+        """
+        return np.array([not self.seen(key, depth) for key in keys], dtype=bool)
+
+    def clear(self):
+        """
+        Forget every state, the counters are kept
+        """
+        self.depths.clear()
+
+    def stats(self):
+        """
+        :return: dict of the counters, to size the table
+        """
+        lookups = self.hits + self.misses
+        return {'size': len(self.depths), 'capacity': self.capacity, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'hit_rate': self.hits / lookups if lookups else 0.0}